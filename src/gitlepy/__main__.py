@@ -1,7 +1,6 @@
 # gitletpy/__main__.py
 """Handles command-line arguments and dispatches to appropriate command."""
 import os.path
-import pickle
 import sys
 from pathlib import Path
 from typing import Tuple
@@ -31,6 +30,8 @@ def main(ctx, repo_home: str) -> None:
 
     ctx.obj = Repo(repo_path)
     # ctx.obj.work_dir = Path(repo_path)
+    # Each invocation runs a single command, so reads can be memoized.
+    ctx.with_resource(ctx.obj.cached())
 
     repo_exists = ctx.obj.gitlepy_dir.exists()
 
@@ -54,18 +55,13 @@ def init(repo) -> None:
     repo.blobs_dir.mkdir()
     repo.commits_dir.mkdir()
     repo.branches_dir.mkdir()
-    # create a file representing the "main" branch
-    Path(repo.branches_dir / "main").touch()
 
     # create HEAD file and set current branch to "main"
-    repo.head.touch()
     repo.head.write_text("main")
 
     # create staging area
-    repo.index.touch()
     new_index = Index(repo.index)
-    with open(repo.index, "wb") as file:
-        pickle.dump(new_index, file)
+    new_index.save()
 
     # Create initial commit.
     repo.new_commit("", "Initial commit.")
@@ -83,8 +79,8 @@ def add(repo, files: Tuple[str]) -> None:
         if not os.path.isfile(os.path.join(repo.work_dir, filename)):
             click.echo(f"{filename} does not exist.")
             sys.exit(1)
-        # Call repository method to stage the file.
-        repo.add(filename)
+    # Call repository method to stage the files.
+    repo.add_many(files)
 
     return
 
@@ -141,7 +137,7 @@ def status(repo) -> None:
 @pass_repo
 def branch(repo, branchname: str, delete: bool) -> None:
     """Creates or deletes a branch with the given name."""
-    branch_path = Path(repo.branches_dir / branchname)
+    branch_path = repo.branches_dir / branchname
     if branch_path.exists() and not delete:
         click.echo("A branch with that name already exists.")
     elif branch_path.exists() and delete:
@@ -151,9 +147,8 @@ def branch(repo, branchname: str, delete: bool) -> None:
         else:
             branch_path.unlink()
     elif not branch_path.exists() and not delete:
-        branch_path.touch()
         # Write current HEAD commit to new branch.
-        branch_path.write_text(repo.head_commit_id())
+        repo.update_branch_head(branchname, repo.head_commit_id())
     else:
         click.echo("Cannot delete: No branch with that name exists.")
 
@@ -1,8 +1,9 @@
 """src/gitlepy/blob.py
 Represents a blob object.
 """
-from hashlib import sha1
-from pathlib import Path
+from hashlib import file_digest
+from os import PathLike
+from typing import Union
 
 
 class Blob:
@@ -13,22 +14,15 @@ class Blob:
     staged for addition.
     """
 
-    def __init__(self, filepath: Path):
+    def __init__(self, filepath: Union[str, PathLike]):
         """Creates a new blob object from the contents of a file.
 
-        The name for the blob is the hash of the file's contents.
-        See the following two SO posts for info on chunking a file for
-        space-efficient hashing: https://stackoverflow.com/a/22058673
-        and https://stackoverflow.com/a/44873382
+        The name for the blob is the hash of the file's contents, which
+        hashlib.file_digest reads in chunks straight into the hash, without
+        holding the whole file in memory.
 
         Args:
-            filename: Name of the file to be recorded as a blob.
+            filepath: Path of the file to be recorded as a blob.
         """
-        sha = sha1()
-        BUF_SIZE: int = 64 * 1024  # 65_536
-        mv = memoryview(bytearray(BUF_SIZE))
         with open(filepath, "rb", buffering=0) as f:
-            while chunk := f.readinto(mv):
-                sha.update(mv[:chunk])
-
-        self.id = sha.hexdigest()
+            self.id = file_digest(f, "sha1").hexdigest()
@@ -3,9 +3,15 @@ Represents a Gitlepy repository's commit object.
 """
 from datetime import datetime
 from hashlib import sha1
+import json
+from pathlib import Path
+import pickle
+from typing import Any
 from typing import Dict
 from typing import Optional
 
+from gitlepy.fileio import atomic_write
+
 
 class Commit:
     """Represents a Gitlepy commit object.
@@ -53,6 +59,45 @@ class Commit:
     def __repr__(self):
         return f"{type(self).__name__}"
 
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the commit's attributes as a JSON-serializable dict."""
+        return {
+            "commit_id": self.commit_id,
+            "parent_one": self.parent_one,
+            "parent_two": self.parent_two,
+            "message": self.message,
+            "timestamp": self.timestamp,
+            "blobs": self.blobs,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Commit":
+        """Recreates a saved commit from the dict returned by to_dict()."""
+        commit = cls.__new__(cls)  # The id and timestamp are not recomputed.
+        commit.commit_id = data["commit_id"]
+        commit.parent_one = data["parent_one"]
+        commit.parent_two = data["parent_two"]
+        commit.message = data["message"]
+        commit.timestamp = data["timestamp"]
+        commit.blobs = data["blobs"]
+        return commit
+
+    def save(self, commit_path: Path) -> None:
+        """Writes the commit to commit_path as JSON."""
+        atomic_write(commit_path, json.dumps(self.to_dict()).encode("utf-8"))
+
+    @classmethod
+    def load(cls, commit_path: Path) -> "Commit":
+        """Reads the commit saved at commit_path.
+
+        Commits written by earlier versions of gitlepy are pickled rather
+        than JSON, and are still read as such.
+        """
+        data = commit_path.read_bytes()
+        if not data.startswith(b"{"):
+            return pickle.loads(data)
+        return cls.from_dict(json.loads(data))
+
     def __str__(self):
         """Formats the commit's information for the log command.
 
@@ -0,0 +1,193 @@
+"""src/gitlepy/diff.py
+Line-level diffs of the files compared during a merge.
+"""
+import difflib
+from bisect import bisect_left
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+# An (i, j) pair: line i of the first file matches line j of the second.
+Match = Tuple[int, int]
+# Same form as the opcodes of difflib.SequenceMatcher.
+Opcode = Tuple[str, int, int, int, int]
+# A tag, "merged" or "conflict", with our lines and their lines.
+Chunk = Tuple[str, Sequence[str], Sequence[str]]
+
+
+def patience_opcodes(a: Sequence[str], b: Sequence[str]) -> List[Opcode]:
+    """Returns the opcodes that turn the lines in `a` into those in `b`,
+    aligned with the patience diff algorithm.
+
+    Lines that occur exactly once in each file anchor the alignment, and the
+    gaps between anchors are aligned in turn. Repeated lines, such as blank
+    lines or lone braces, never anchor it, which keeps large files with many
+    similar lines from being matched up line by line.
+
+    Args:
+        a: Lines of the first file.
+        b: Lines of the second file.
+    """
+    opcodes: List[Opcode] = []
+    i = j = 0
+    for ai, bj in _patience_matches(a, b) + [(len(a), len(b))]:
+        if i < ai or j < bj:
+            if i == ai:
+                tag = "insert"
+            elif j == bj:
+                tag = "delete"
+            else:
+                tag = "replace"
+            opcodes.append((tag, i, ai, j, bj))
+        if ai < len(a):
+            # Extend the previous run of equal lines where possible.
+            if opcodes and opcodes[-1][0] == "equal" and opcodes[-1][2] == ai:
+                _, i1, _, j1, _ = opcodes.pop()
+                opcodes.append(("equal", i1, ai + 1, j1, bj + 1))
+            else:
+                opcodes.append(("equal", ai, ai + 1, bj, bj + 1))
+        i, j = ai + 1, bj + 1
+    return opcodes
+
+
+def diff3_chunks(
+    base: Sequence[str], ours: Sequence[str], theirs: Sequence[str]
+) -> List[Chunk]:
+    """Merges the lines of two files descended from a common `base`, in the
+    manner of diff3.
+
+    Both files are aligned against `base`. Lines matched in all three are
+    stable and taken as is. Each run between stable lines is merged cleanly
+    if only one side changed it, or if both changed it the same way, and is
+    otherwise a conflict. Merged chunks hold the same lines on both sides.
+
+    Args:
+        base: Lines of the common ancestor.
+        ours: Lines of the file in the current branch.
+        theirs: Lines of the file in the branch being merged.
+    """
+    ours_at = dict(_patience_matches(base, ours))
+    theirs_at = dict(_patience_matches(base, theirs))
+
+    chunks: List[Chunk] = []
+    b = o = t = 0
+    while True:
+        # Take the run of lines that are stable in all three.
+        start = o
+        while b < len(base) and ours_at.get(b) == o and theirs_at.get(b) == t:
+            b, o, t = b + 1, o + 1, t + 1
+        if start < o:
+            chunks.append(("merged", ours[start:o], ours[start:o]))
+
+        # The next stable line ends the run that changed on either side.
+        synced = (k for k in range(b, len(base)) if k in ours_at and k in theirs_at)
+        sync = next(synced, None)
+        if sync is None:
+            b_end, o_end, t_end = len(base), len(ours), len(theirs)
+        else:
+            b_end, o_end, t_end = sync, ours_at[sync], theirs_at[sync]
+        if b < b_end or o < o_end or t < t_end:
+            run = _merge_run(base[b:b_end], ours[o:o_end], theirs[t:t_end])
+            chunks.append(run)
+        if sync is None:
+            return chunks
+        b, o, t = b_end, o_end, t_end
+
+
+def _merge_run(
+    base: Sequence[str], ours: Sequence[str], theirs: Sequence[str]
+) -> Chunk:
+    """Merges a run of lines changed on at least one side since `base`."""
+    if ours == theirs or theirs == base:
+        return ("merged", ours, ours)
+    if ours == base:
+        return ("merged", theirs, theirs)
+    return ("conflict", ours, theirs)
+
+
+def _patience_matches(a: Sequence[str], b: Sequence[str]) -> List[Match]:
+    """Returns the sorted list of matching line pairs between `a` and `b`.
+
+    Ranges left to align are kept on a stack rather than recursed into, so
+    that long files cannot exceed the recursion limit.
+    """
+    matches: List[Match] = []
+    stack = [(0, len(a), 0, len(b))]
+
+    while stack:
+        alo, ahi, blo, bhi = stack.pop()
+
+        # Lines common to the start or end of both ranges match as is.
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_anchors(a, alo, ahi, b, blo, bhi)
+        if not anchors:
+            # Without unique lines, fall back on difflib for this gap.
+            matcher = difflib.SequenceMatcher(
+                a=a[alo:ahi], b=b[blo:bhi], autojunk=False
+            )
+            for i, j, size in matcher.get_matching_blocks():
+                matches.extend((alo + i + k, blo + j + k) for k in range(size))
+            continue
+
+        # Align the gaps before, between and after the anchors.
+        matches.extend(anchors)
+        prev_a, prev_b = alo, blo
+        for ai, bj in anchors:
+            stack.append((prev_a, ai, prev_b, bj))
+            prev_a, prev_b = ai + 1, bj + 1
+        stack.append((prev_a, ahi, prev_b, bhi))
+
+    matches.sort()
+    return matches
+
+
+def _unique_anchors(
+    a: Sequence[str], alo: int, ahi: int, b: Sequence[str], blo: int, bhi: int
+) -> List[Match]:
+    """Returns the longest run of lines, in the same order in both ranges,
+    that occur exactly once in a[alo:ahi] and once in b[blo:bhi].
+    """
+    a_counts = Counter(a[alo:ahi])
+    b_index = {}
+    for j in range(blo, bhi):
+        line = b[j]
+        if a_counts[line] == 1:
+            # A repeated line is flagged with -1.
+            b_index[line] = -1 if line in b_index else j
+    pairs = [
+        (i, b_index[a[i]])
+        for i in range(alo, ahi)
+        if b_index.get(a[i], -1) >= 0 and a_counts[a[i]] == 1
+    ]
+
+    # Longest increasing subsequence of the b positions, by patience sorting:
+    # tails[k] is the smallest b position ending an increasing run of k + 1.
+    tails: List[int] = []
+    tail_pairs: List[int] = []
+    prev: List[int] = []
+    for n, (_, bj) in enumerate(pairs):
+        k = bisect_left(tails, bj)
+        prev.append(tail_pairs[k - 1] if k else -1)
+        if k == len(tails):
+            tails.append(bj)
+            tail_pairs.append(n)
+        else:
+            tails[k] = bj
+            tail_pairs[k] = n
+
+    anchors: List[Match] = []
+    n = tail_pairs[-1] if tail_pairs else -1
+    while n >= 0:
+        anchors.append(pairs[n])
+        n = prev[n]
+    anchors.reverse()
+    return anchors
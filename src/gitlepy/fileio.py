@@ -0,0 +1,66 @@
+"""src/gitlepy/fileio.py
+Helpers for writing the files of a Gitlepy repository.
+"""
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Replaces the contents of the file at path with data in one step.
+
+    The data is first written to a uniquely named, hidden temporary file in
+    the same directory, which is then renamed over the destination. Readers therefore
+    see either the old or the new contents, never a partially written file,
+    even if gitlepy is interrupted mid-write.
+
+    Args:
+        path: File to be written, which need not exist yet.
+        data: The file's new contents.
+    """
+    fd, temp = _temp_file(path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+
+def atomic_copy(src: Path, dst: Path) -> None:
+    """Copies the file at src to dst in one step.
+
+    Like atomic_write(), the copy is made to a hidden temporary file that is
+    then renamed over dst, so a copy interrupted midway never leaves dst
+    holding part of the file.
+
+    Args:
+        src: File to be copied.
+        dst: Destination file, which need not exist yet.
+    """
+    fd, temp = _temp_file(dst)
+    os.close(fd)
+    try:
+        shutil.copyfile(src, temp)
+        os.replace(temp, dst)
+    except BaseException:
+        temp.unlink(missing_ok=True)
+        raise
+
+
+def _temp_file(path: Path) -> Tuple[int, Path]:
+    """Creates a temporary file to be renamed over path, returning its open
+    file descriptor and its path.
+
+    The name is unique, so concurrent writes to the same path each get their
+    own temporary file and an existing file is never clobbered. The file is
+    given the mode a newly created file would have, rather than mkstemp's 0600.
+    """
+    fd, name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(fd, 0o666 & ~umask)
+    return fd, Path(name)
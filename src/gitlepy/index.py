@@ -1,10 +1,25 @@
 """src/gitlepy/index.py
 Represents a Gitlepy repository's staging area.
 """
+import json
+import os
 from pathlib import Path
 import pickle
+import time
+from typing import Any
 from typing import Dict
+from typing import Optional
 from typing import Set
+from typing import Tuple
+
+from gitlepy.fileio import atomic_write
+
+# A file changed this recently (in nanoseconds) may be changed again without
+# its timestamps changing, given the timestamp granularity of some file systems.
+RACY_NS = 2_000_000_000
+
+# A stat cache entry: (size, mtime_ns, ctime_ns, inode, blob id).
+StatEntry = Tuple[int, int, int, int, str]
 
 
 class Index:
@@ -13,6 +28,13 @@ class Index:
     It uses two data structures to manage it: additions are implemented with a
     dictionary {"filename": "file contents"}, and removals with a set of
     filenames.
+
+    It also keeps a stat cache, {"filename": (size, mtime_ns, ctime_ns,
+    inode, blob id)}, which records the blob ID of a working file as of its
+    last hashing. While the file's stat is unchanged, that ID can be reused
+    without reading the file again. As in git, the ctime and inode catch
+    edits that keep the size and restore the mtime, such as `cp -p`, since
+    neither can be set back by the user.
     """
 
     def __init__(
@@ -30,6 +52,47 @@ class Index:
         self.path = index_path
         self.additions = additions
         self.removals = removals
+        self.stat_cache: Dict[str, StatEntry] = {}
+
+    def __setstate__(self, state: dict) -> None:
+        # Indexes pickled before the stat cache existed lack the attribute.
+        state.setdefault("stat_cache", {})
+        self.__dict__.update(state)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the staging area as a JSON-serializable dict."""
+        return {
+            "additions": self.additions,
+            "removals": sorted(self.removals),
+            "stat_cache": self.stat_cache,
+        }
+
+    @classmethod
+    def from_dict(cls, index_path: Path, data: Dict[str, Any]) -> "Index":
+        """Recreates a saved staging area from the dict returned by to_dict().
+
+        Args:
+            index_path (Path): Location of the index file.
+            data (dict): The staging area as returned by to_dict().
+        """
+        index = cls(index_path, data["additions"], set(data["removals"]))
+        index.stat_cache = {k: tuple(v) for k, v in data["stat_cache"].items()}
+        return index
+
+    @classmethod
+    def load(cls, index_path: Path) -> "Index":
+        """Reads the staging area saved at index_path.
+
+        Indexes written by earlier versions of gitlepy are pickled rather
+        than JSON. They are still read, and saved as JSON the next time the
+        staging area changes.
+        """
+        data = index_path.read_bytes()
+        if not data.startswith(b"{"):
+            index = pickle.loads(data)
+            index.path = index_path
+            return index
+        return cls.from_dict(index_path, json.loads(data))
 
     def __repr__(self):
         return f"{type(self).__name__}"
@@ -59,13 +122,37 @@ class Index:
         self.removals.clear()
 
     def save(self) -> None:
-        """Writes the index to the repository."""
-        with open(self.path, "wb") as file:
-            pickle.dump(self, file)
+        """Writes the index to the repository as JSON."""
+        atomic_write(self.path, json.dumps(self.to_dict()).encode("utf-8"))
+
+    def cached_blob_id(self, filename: str, st: os.stat_result) -> Optional[str]:
+        """Returns the blob ID recorded for the file if its stat is unchanged.
+
+        Args:
+            filename (str): Name of the file in the working directory.
+            st (os.stat_result): Current stat of the file.
+        """
+        entry = self.stat_cache.get(filename)
+        if entry and entry[:4] == _stat_key(st):
+            return entry[4]
+        return None
+
+    def cache_blob_id(self, filename: str, st: os.stat_result, blob_id: str) -> None:
+        """Records the blob ID of the file as hashed with the given stat.
+
+        Files changed too recently to trust their timestamps are not
+        recorded, so that they are hashed again next time. The ctime counts
+        too, so a file whose mtime was set back just after an edit is not
+        trusted either.
+        """
+        if time.time_ns() - max(st.st_mtime_ns, st.st_ctime_ns) < RACY_NS:
+            self.stat_cache.pop(filename, None)
+        else:
+            self.stat_cache[filename] = _stat_key(st) + (blob_id,)
 
     def is_staged(self, filename: str) -> bool:
         """Determines whether the given file is staged for addition."""
-        return filename in self.additions.keys()
+        return filename in self.additions
 
     # def getAdditions(self) -> Dict[str, str]:
     #     """Provides access to the mapping of files staged for addition."""
@@ -74,3 +161,8 @@ class Index:
     # def getRemovals(self) -> Set[str]:
     #     """Provides access to the names of files staged for removal."""
     #     return self.removals
+
+
+def _stat_key(st: os.stat_result) -> Tuple[int, int, int, int]:
+    """Returns the parts of a file's stat recorded in the stat cache."""
+    return (st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino)
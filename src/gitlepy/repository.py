@@ -1,19 +1,36 @@
 """Repository module for Gitlepy.
 Handles the logic for managing a Gitlepy repository.
 All commands from gitlepy.main are dispatched to various functions in this module."""
-import pickle
+import os
 import shutil
-import tempfile
-from filecmp import cmp
-from os import remove
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from queue import SimpleQueue
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from gitlepy.blob import Blob
 from gitlepy.commit import Commit
+from gitlepy.diff import Chunk, diff3_chunks, patience_opcodes
+from gitlepy.fileio import atomic_copy, atomic_write
 from gitlepy.index import Index
 
+# Threads used to copy and delete working files, which is I/O bound.
+IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Marks left on commits by Repo._mark_ancestors: reached from the HEAD commit,
+# from the target commit, or from a common ancestor of the two.
+FROM_HEAD = 1
+FROM_TARGET = 2
+FROM_BOTH = FROM_HEAD | FROM_TARGET
+STALE = 4
+
+# Working files, blobs tracked by the HEAD commit and the staging area.
+Snapshot = Tuple[set[str], Dict[str, str], Index]
+# Blobs tracked by the HEAD, target and split commits of a merge.
+MergeBlobs = Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]
+
 
 class Repo:
     """A Gitlepy repository object.
@@ -55,102 +72,171 @@ class Repo:
 
     def __init__(self, repo_path: Path):
         self.work_dir: Path = repo_path
-        self.gitlepy_dir: Path = Path(self.work_dir / ".gitlepy")
-        self.blobs_dir: Path = Path(self.gitlepy_dir / "blobs")
-        self.commits_dir: Path = Path(self.gitlepy_dir, "commits")
-        self.branches_dir: Path = Path(self.gitlepy_dir, "refs")
-        self.index: Path = Path(self.gitlepy_dir, "index")
-        self.head: Path = Path(self.gitlepy_dir, "HEAD")
+        self.gitlepy_dir: Path = self.work_dir / ".gitlepy"
+        self.blobs_dir: Path = self.gitlepy_dir / "blobs"
+        self.commits_dir: Path = self.gitlepy_dir / "commits"
+        self.branches_dir: Path = self.gitlepy_dir / "refs"
+        self.index: Path = self.gitlepy_dir / "index"
+        self.head: Path = self.gitlepy_dir / "HEAD"
+        # String forms for joining filenames in per-file loops, which is much
+        # cheaper than constructing a Path for each file.
+        self._work_dir_str: str = str(self.work_dir)
+        self._blobs_dir_str: str = str(self.blobs_dir)
+
+        # Reads of refs memoized while inside Repo.cached().
+        self._caching: bool = False
+        self._branches_cache: Optional[List[str]] = None
+        self._commits_cache: Optional[List[str]] = None
+        self._current_branch: Optional[str] = None
+        self._head_commit_id: Optional[str] = None
+        # Commit objects never change once written, so loaded ones are kept
+        # for the lifetime of the Repo.
+        self._commit_objects: Dict[str, Commit] = {}
+
+    @contextmanager
+    def cached(self) -> Iterator["Repo"]:
+        """Memoizes reads of the repository for the duration of one command.
+
+        Outside of this context every call goes back to the file system, so
+        a long-lived Repo object never returns stale results.
+        """
+        self._caching = True
+        try:
+            yield self
+        finally:
+            self._caching = False
+            self._invalidate_caches()
+
+    def _invalidate_caches(self) -> None:
+        """Drops memoized reads after the repository has been written to."""
+        self._branches_cache = None
+        self._commits_cache = None
+        self._current_branch = None
+        self._head_commit_id = None
 
     def branches(self) -> List[str]:
         """Returns a list of branch names."""
-        assert (
-            self.branches_dir.exists()
-        ), "Error: Gitlepy's branches directory does not exist."
-        path_list = list(self.branches_dir.glob("*"))
-        result = []
-        for file in path_list:
-            result.append(file.name)
-        return result
+        if self._branches_cache is not None:
+            return self._branches_cache
+        try:
+            with os.scandir(self.branches_dir) as entries:
+                branches = [e.name for e in entries if not e.name.startswith(".")]
+        except FileNotFoundError:
+            print("Error: Gitlepy's branches directory does not exist.")
+            raise SystemExit(1)
+        if self._caching:
+            self._branches_cache = branches
+        return branches
 
     def commits(self) -> List[str]:
-        """Returns a list of commit ids."""
-        if not self.commits_dir.exists():
+        """Returns a sorted list of commit ids."""
+        if self._commits_cache is not None:
+            return self._commits_cache
+        try:
+            with os.scandir(self.commits_dir) as entries:
+                commits = [e.name for e in entries if not e.name.startswith(".")]
+        except FileNotFoundError:
             print("Error: Gitlepy's commits directory does not exist.")
             raise SystemExit(1)
-        path_list = list(self.commits_dir.glob("*"))
-        result = []
-        for file in path_list:
-            result.append(file.name)
-        return result
+        commits.sort()
+        if self._caching:
+            self._commits_cache = commits
+        return commits
 
     def current_branch(self) -> str:
         """Returns the name of the currently checked out branch."""
-        return self.head.read_text()
+        if self._current_branch is not None:
+            return self._current_branch
+        branch = self.head.read_text()
+        if self._caching:
+            self._current_branch = branch
+        return branch
 
     def head_commit_id(self) -> str:
         """Returns the ID of the currrently checked out commit."""
-        return Path(self.branches_dir / self.current_branch()).read_text()
+        if self._head_commit_id is not None:
+            return self._head_commit_id
+        commit_id = (self.branches_dir / self.current_branch()).read_text()
+        if self._caching:
+            self._head_commit_id = commit_id
+        return commit_id
 
     def get_branch_head(self, branch: str) -> str:
         """Returns the head commit ID of the given branch."""
         assert branch in self.branches(), "Not a valid branch name."
         # Define Path object for the branch reference file.
-        p = Path(self.branches_dir / branch)
+        p = self.branches_dir / branch
         return p.read_text()
 
     def load_commit(self, commit_id: str) -> Commit:
-        """Returns the Commit object with the specified ID."""
-        commit_path = Path(self.commits_dir / commit_id)
+        """Returns the Commit object with the specified ID.
+
+        The returned object is shared with later calls and must not be
+        modified.
+        """
+        if commit_id in self._commit_objects:
+            return self._commit_objects[commit_id]
+        commit_path = self.commits_dir / commit_id
         if not commit_path.exists():
             raise SystemExit(1, "Commit object does not exist.")
-        with commit_path.open("rb") as file:
-            return pickle.load(file)
+        commit = Commit.load(commit_path)
+        self._commit_objects[commit_id] = commit
+        return commit
 
     def load_index(self) -> Index:
         """Loads the staging area, i.e. the Index object."""
-        with self.index.open("rb") as file:
-            return pickle.load(file)
+        return Index.load(self.index)
+
+    def load_blob(self, blob_id: str) -> bytes:
+        """Returns the file contents recorded by the specified blob.
 
-    def load_blob(self, blob_id: str) -> Blob:
-        p = Path(self.blobs_dir / blob_id)
-        with p.open("rb") as file:
-            return pickle.load(file)
+        Blobs are stored as the raw bytes of the staged file, so that they
+        can be compared against and copied to the working directory as is.
+        """
+        return (self.blobs_dir / blob_id).read_bytes()
 
     def get_blobs(self, commit_id: str) -> Dict[str, str]:
-        """Returns the dictionary of blobs belonging to the commit object with the
-        specified commit_id.
+        """Returns a copy of the dictionary of blobs belonging to the commit
+        object with the specified commit_id.
 
         Args:
             commit_id: Name of the commit.
         """
         commit_obj = self.load_commit(commit_id)
-        return commit_obj.blobs
+        return dict(commit_obj.blobs)
 
-    def working_files(self) -> list[str]:
-        """Returns a list of non-hidden files in the working directory."""
-        all_paths: list[Path] = list(self.work_dir.glob("*"))
-        working_files = [
-            file.name for file in all_paths if not file.name.startswith(".")
-        ]
-        return working_files
+    def working_files(self) -> set[str]:
+        """Returns the set of non-hidden files in the working directory."""
+        with os.scandir(self.work_dir) as entries:
+            return {e.name for e in entries if not e.name.startswith(".")}
+
+    def _snapshot(self) -> Snapshot:
+        """Returns the working files, the blobs tracked by the HEAD commit and
+        the staging area, so that they can be read once and shared between
+        the methods that compare them.
+        """
+        return (
+            self.working_files(),
+            self.get_blobs(self.head_commit_id()),
+            self.load_index(),
+        )
 
-    def untracked_files(self) -> list[str]:
+    def untracked_files(self, snapshot: Optional[Snapshot] = None) -> list[str]:
         """Returns a list of files in the working directory that are neither
         tracked by the current commit nor staged for addition; also includes
         files staged for removal and then recreated.
+
+        Args:
+            snapshot: State of the repository as returned by _snapshot().
+                It is read from the file system if not given.
         """
         untracked_files: list[str] = []
+        working_files, tracked_blobs, index = snapshot or self._snapshot()
 
         # Create a set of all tracked or staged files.
-        tracked_files: set = set(self.get_blobs(self.head_commit_id()).keys())
+        tracked_files: set = tracked_blobs.keys() | index.additions.keys()
 
-        index = self.load_index()
-        staged_files: set = set(index.additions.keys())
-
-        tracked_files = tracked_files.union(staged_files)
-
-        for file in self.working_files():
+        for file in working_files:
             if file not in tracked_files or file in index.removals:
                 untracked_files.append(file)
 
@@ -158,7 +244,7 @@ class Repo:
 
         return untracked_files
 
-    def unstaged_modifications(self) -> list[str]:
+    def unstaged_modifications(self, snapshot: Optional[Snapshot] = None) -> list[str]:
         """Returns a list of tracked files modified but not staged,
         including a parenthetical indication of whether the file has been
         modified or deleted.
@@ -169,15 +255,15 @@ class Repo:
         - staged for addition but deleted in the working directory;
         - tracked in the current commit and deleted from the working directory,
           but not staged for removal.
+
+        Args:
+            snapshot: State of the repository as returned by _snapshot().
+                It is read from the file system if not given.
         """
         unstaged_files: list[str] = []
+        working_files, tracked_blobs, index = snapshot or self._snapshot()
 
-        working_files: list[str] = self.working_files()
-        tracked_blobs: dict[str, str] = self.get_blobs(self.head_commit_id())
-
-        index: Index = self.load_index()
-
-        for filename in tracked_blobs.keys():
+        for filename in tracked_blobs:
             # File was deleted but not staged for removal
             if self._unstaged_deletion(filename, working_files, index):
                 unstaged_files.append(f"{filename} (deleted)")
@@ -197,14 +283,14 @@ class Repo:
         for filename in index.additions.keys() - tracked_blobs.keys():
             if filename not in working_files:
                 unstaged_files.append(f"{filename} (deleted)")
-            elif not self._cmp_blobs(filename, index.additions[filename]):
+            elif not self._cmp_blobs(filename, index.additions[filename], index):
                 unstaged_files.append(f"{filename} (modified)")
 
         unstaged_files.sort()
         return unstaged_files
 
     def _unstaged_deletion(
-        self, filename, working_files: list[str], index: Index
+        self, filename, working_files: set[str], index: Index
     ) -> bool:
         """Returns True if the file specified by filename has been deleted but
         not staged for removal.
@@ -216,7 +302,7 @@ class Repo:
         since being staged for addition.
         """
         try:
-            return not self._cmp_blobs(filename, index.additions[filename])
+            return not self._cmp_blobs(filename, index.additions[filename], index)
         except KeyError:
             return False
 
@@ -226,46 +312,54 @@ class Repo:
         """Returns True if the file is tracked, not staged for addition, and
         has been modified.
         """
-        if filename not in index.additions.keys():
-            return not self._cmp_blobs(filename, tracked_blobs[filename])
+        if filename not in index.additions:
+            return not self._cmp_blobs(filename, tracked_blobs[filename], index)
         else:
             return False
 
-    def _cmp_blobs(self, filename: str, blob_id: str) -> bool:
+    def _cmp_blobs(self, filename: str, blob_id: str, index: Index) -> bool:
         """Returns true if the file and its corresponding blob are the same.
 
-        This method wraps filecmp.cmp(f1, f2[, shallow=True]) and only adds
-        the path to the specified file names before passing them to filecmp.cmp.
+        A blob is named after the hash of its contents, so only the file in
+        the working directory needs to be read: it is hashed the same way
+        and compared with the blob's name. If the index's stat cache shows
+        the file unchanged since it was last hashed, it is not read at all.
 
         Args:
             filename: Name of the file in the working directory.
             blob_id: Name of the blob file in the blobs directory.
+            index: Staging area holding the stat cache.
         """
-        file = Path(self.work_dir / filename)
-        blob = Path(self.blobs_dir / blob_id)
-        return cmp(file, blob)
+        return self._blob_id(filename, index) == blob_id
 
     def new_commit(
-        self, parent: str, message: str, merge_parent: Optional[str] = None
+        self,
+        parent: str,
+        message: str,
+        merge_parent: Optional[str] = None,
+        index: Optional[Index] = None,
     ) -> None:
         """Creates a new Commit object and saves to the repostiory.
 
         Args:
             parent: ID of the parent commit.
             message: Commit message.
+            merge_parent: In the event of a merge, ID of the merged commit.
+                A merge commit is made even if nothing is staged, since it
+                still records that the branches were merged.
+            index: Staging area, if already loaded by the caller.
         """
         c = Commit(parent, message, merge_parent)
-        c_file = Path.joinpath(self.commits_dir, c.commit_id)
 
         if parent == "":  # initial commit can be saved immediately
-            with c_file.open("wb") as f:
-                pickle.dump(c, f)
+            self._save_commit(c)
             self.update_branch_head(self.current_branch(), c.commit_id)
             return
 
         # Load the index and ensure files are staged for commit.
-        index = self.load_index()
-        if not index.additions and not index.removals:
+        if index is None:
+            index = self.load_index()
+        if not index.additions and not index.removals and merge_parent is None:
             print("No changes staged for commit.")
             raise SystemExit(0)
 
@@ -284,15 +378,22 @@ class Repo:
         index.save()
 
         # Save the commit
-        with c_file.open("wb") as f:
-            pickle.dump(c, f)
+        self._save_commit(c)
 
         self.update_branch_head(self.current_branch(), c.commit_id)
         return
 
+    def _save_commit(self, c: Commit) -> None:
+        """Writes the Commit object to the commits directory."""
+        c.save(Path.joinpath(self.commits_dir, c.commit_id))
+        self._commit_objects[c.commit_id] = c
+        self._invalidate_caches()
+
     def update_branch_head(self, branch: str, commit_id: str) -> None:
-        """Updates the HEAD reference of the specified branch."""
-        Path(self.branches_dir / branch).write_text(commit_id)
+        """Updates the HEAD reference of the specified branch, creating the
+        branch if it does not yet exist."""
+        atomic_write(self.branches_dir / branch, commit_id.encode())
+        self._invalidate_caches()
         return
 
     def add(self, filename: str) -> None:
@@ -304,41 +405,74 @@ class Repo:
         Args:
             filename: Name of the file in the working directory to be staged.
         """
-        # Create Path object and associated blob
-        filepath = Path(self.work_dir / filename)
-        new_blob = Blob(filepath)
+        self.add_many([filename])
 
+    def add_many(self, filenames: Iterable[str]) -> None:
+        """Stages several files in the working directory for addition.
+
+        The staging area and the current commit are loaded once, and the
+        staging area is saved once, no matter how many files are staged.
+
+        Args:
+            filenames: Names of the files in the working directory to be staged.
+        """
         # Load the staging area.
         index = self.load_index()
+        head_blobs = self.load_commit(self.head_commit_id()).blobs
+
+        for filename in filenames:
+            self._stage_file(filename, index, head_blobs)
+
+        # Save the staging area.
+        index.save()
+
+    def _stage_file(
+        self, filename: str, index: Index, head_blobs: Dict[str, str]
+    ) -> None:
+        """Stages a single file in the given, already loaded, staging area.
+
+        Args:
+            filename: Name of the file in the working directory to be staged.
+            index: Staging area, saved by the caller.
+            head_blobs: Blobs tracked by the current commit.
+        """
+        # Create Path object and find its blob ID, which only requires hashing
+        # the file if it has changed since last hashed.
+        filepath = self.work_dir / filename
+        new_blob_id = self._blob_id(filename, index)
 
         # Is it unchanged since most recent commit?
-        head_commit = self.load_commit(self.head_commit_id())
-        if (  # First condition avoids KeyError in blobs dict.
-            not filename not in head_commit.blobs.keys() and
-            new_blob.id == head_commit.blobs[filename]
-        ):
+        # Blob IDs are content hashes, so equal IDs mean equal contents.
+        if new_blob_id == head_blobs.get(filename):
             # Yes -> Do not stage, and remove if already staged.
             if index.is_staged(filename):
                 index.unstage(filename)
             else:
                 print("No changes have been made to that file.")
         # Check whether file is already staged as well as since changed.
-        elif (
-            filename in index.additions.keys() and
-            new_blob.id == index.additions[filename]
-        ):
+        elif new_blob_id == index.additions.get(filename):
             print("File is already staged in present state.")
         else:
             # Stage file with blob in the staging area.
-            index.stage(filename, new_blob.id)
+            index.stage(filename, new_blob_id)
 
-            # Save the blob.
-            blob_path = Path(self.blobs_dir / new_blob.id)
-            with blob_path.open("wb") as f:
-                f.write(filepath.read_bytes())
+            # Save the blob as the raw contents of the file. Blobs are named
+            # after their contents, so an existing blob is never rewritten.
+            blob_path = self.blobs_dir / new_blob_id
+            if not blob_path.exists():
+                atomic_copy(filepath, blob_path)
 
-        # Save the staging area.
-        index.save()
+    def _blob_id(self, filename: str, index: Index) -> str:
+        """Returns the blob ID for a file in the working directory, using the
+        index's stat cache to avoid rehashing an unchanged file.
+        """
+        filepath = os.path.join(self._work_dir_str, filename)
+        st = os.stat(filepath)
+        blob_id = index.cached_blob_id(filename, st)
+        if blob_id is None:
+            blob_id = Blob(filepath).id
+            index.cache_blob_id(filename, st, blob_id)
+        return blob_id
 
     def remove(self, filename: str) -> None:
         """If the file is staged for addition, unstages it. Otherwise, if
@@ -354,7 +488,7 @@ class Repo:
             print("That file is already staged for removal.")
             return
 
-        tracked_files = list(self.get_blobs(self.head_commit_id()).keys())
+        tracked_files = self.load_commit(self.head_commit_id()).blobs
 
         if filename in index.additions:
             # Stage for removal and save the index.
@@ -364,7 +498,7 @@ class Repo:
             index.remove(filename)
             index.save()
             # Delete it if not already deleted.
-            file_path = Path(self.work_dir / filename)
+            file_path = self.work_dir / filename
             if file_path.exists():
                 file_path.unlink()
         else:  # Neither staged nor tracked -> do nothing.
@@ -395,10 +529,11 @@ class Repo:
             print(f"{filename} is not a valid file.")
         else:  # Checkout the file
             # Path for file in working directory
-            filepath = Path(self.work_dir / filename)
+            filepath = self.work_dir / filename
             # Path for the blob
-            blob = Path(self.blobs_dir / commit.blobs[filename])
-            filepath.write_text(blob.read_text())
+            blob = self.blobs_dir / commit.blobs[filename]
+            # Copy the bytes as is, letting the OS use a zero-copy transfer.
+            shutil.copyfile(blob, filepath)
 
     def checkout_branch(self, target: str) -> None:
         """Checks out the given branch.
@@ -412,15 +547,17 @@ class Repo:
             print(f"Already on '{target}'")
             return
 
-        if self.unstaged_modifications():
+        snapshot: Snapshot = self._snapshot()
+        if self.unstaged_modifications(snapshot):
             print("There are unstaged modifications in the way; stage and commit them.")
             return
 
         old_head: str = self.head_commit_id()
         # Update HEAD to reference target branch
-        self.head.write_text(target)
+        atomic_write(self.head, target.encode())
+        self._invalidate_caches()
         # Checkout the head commit for target branch.
-        self._checkout_commit(old_head, self.get_branch_head(target))
+        self._checkout_commit(old_head, self.get_branch_head(target), snapshot[2])
 
     def reset(self, target_id: str) -> None:
         """Resets the current branch to the specified commit."""
@@ -430,13 +567,12 @@ class Repo:
             print("No commit with that id exists.")
             return
 
+        # Also updates current branch HEAD to reference checked out commit.
         self._checkout_commit(self.head_commit_id(), target_commit_id)
 
-        # Update current branch HEAD to reference checked out commit.
-        current_branch_path = Path(self.branches_dir / self.current_branch())
-        current_branch_path.write_text(target_commit_id)
-
-    def _checkout_commit(self, old_head_id: str, target_id: str) -> None:
+    def _checkout_commit(
+        self, old_head_id: str, target_id: str, index: Optional[Index] = None
+    ) -> None:
         """Checks out the given commit.
 
         This serves both the `gitlepy reset` and the `gitlepy checkout branch`
@@ -447,28 +583,39 @@ class Repo:
         HEAD of the current branch to that commit.
 
         Args:
+            old_head_id: id of the commit currently checked out.
             target_id: id of the commit, can be abbreviated.
+            index: Staging area, if already loaded by the caller.
         """
         target_blobs: dict = self.get_blobs(target_id)
 
-        # Delete files tracked by current commit and untracked by target commit.
         current_blobs: dict = self.get_blobs(old_head_id)
-        for filename in current_blobs.keys():
-            if filename not in target_blobs.keys():
-                Path(self.work_dir / filename).unlink()
 
-        # Load file contents from blobs.
-        for filename in target_blobs.keys():
-            file = Path(self.work_dir / filename)
-            blob = Path(self.blobs_dir / target_blobs[filename])
-            file.write_text(blob.read_text())
-            # with open(file, "wt") as f, open(blob, "rb") as b:
+        # Each file is handled independently, so the work is spread across
+        # threads, which release the GIL while waiting on the file system.
+        # Consuming each map() re-raises the first error, if any.
+        with ThreadPoolExecutor(max_workers=IO_WORKERS) as pool:
+            # Delete files tracked by current commit and untracked by target.
+            removed = [
+                os.path.join(self._work_dir_str, filename)
+                for filename in current_blobs.keys() - target_blobs.keys()
+            ]
+            list(pool.map(os.unlink, removed))
+
+            # Load file contents from blobs.
+            blobs = [
+                os.path.join(self._blobs_dir_str, blob_id)
+                for blob_id in target_blobs.values()
+            ]
+            files = [os.path.join(self._work_dir_str, f) for f in target_blobs]
+            list(pool.map(shutil.copyfile, blobs, files))
 
         # Update current branch's HEAD ref
         self.update_branch_head(self.current_branch(), target_id)
 
         # clear the staging area
-        index = self.load_index()
+        if index is None:
+            index = self.load_index()
         index.clear()
         index.save()
 
@@ -477,15 +624,17 @@ class Repo:
         If `target` < 40 characters, then it will treat it as an abbreviation
         and try to find a matching commit.
         """
+        commit_ids = self.commits()
+        # Commit ids sharing the prefix `target` sit together in sorted order,
+        # beginning at the position where `target` would be inserted.
+        i = bisect_left(commit_ids, target)
         # if target in commit ids, then return "commit"
-        if target in self.commits():
+        if i < len(commit_ids) and commit_ids[i] == target:
             return target
         # else try to find a match for abbreviate commit id
         elif len(target) < 40:
-            matches = []
-            for id in self.commits():
-                if id.startswith(target):
-                    matches.append(id)
+            # Two matches suffice to tell whether the abbreviation is ambiguous.
+            matches = [id for id in commit_ids[i:i + 2] if id.startswith(target)]
             if len(matches) > 1:
                 print("Ambiguous commit abbreviation.")
                 raise SystemExit(0)
@@ -502,35 +651,34 @@ class Repo:
 
     def status(self) -> str:
         """Returns a string representation of the repository's current status."""
-        output: str = ""
+        # Sections are collected in a list and joined once at the end.
+        output: list[str] = []
         # Branches
-        output = "=== Branches ===\n"
+        output.append("=== Branches ===\n")
+        current_branch = self.current_branch()
         for branch in self.branches():
-            if branch == self.current_branch():
-                output += "*"
-            output += f"{branch}\n"
+            if branch == current_branch:
+                output.append("*")
+            output.append(f"{branch}\n")
 
         # Staging Area
-        index = self.load_index()
+        snapshot = self._snapshot()
+        index = snapshot[2]
         # Staged Files
-        output += "\n=== Staged Files ===\n"
-        for file in index.additions:
-            output += f"{file}\n"
+        output.append("\n=== Staged Files ===\n")
+        output.extend(f"{file}\n" for file in index.additions)
         # Removed Files
-        output += "\n=== Removed Files ===\n"
-        for file in index.removals:
-            output += f"{file}\n"
+        output.append("\n=== Removed Files ===\n")
+        output.extend(f"{file}\n" for file in index.removals)
 
         # Modifications Not Staged For Commit
-        output += "\n=== Modifications Not Staged For Commit ===\n"
-        for file in self.unstaged_modifications():
-            output += f"{file}\n"
+        output.append("\n=== Modifications Not Staged For Commit ===\n")
+        output.extend(f"{file}\n" for file in self.unstaged_modifications(snapshot))
         # Untracked Files
-        output += "\n=== Untracked Files ===\n"
-        for file in self.untracked_files():
-            output += f"{file}\n"
+        output.append("\n=== Untracked Files ===\n")
+        output.extend(f"{file}\n" for file in self.untracked_files(snapshot))
 
-        return output
+        return "".join(output)
 
     def merge(self, target: str) -> None:
         """Merges the current branch with the specified `target` branch.
@@ -539,37 +687,46 @@ class Repo:
         and the head of the given branch, it stages files for addition or
         removal before creating a new commit.
         """
+        # Read the state of the repository once for the whole merge.
+        snapshot: Snapshot = self._snapshot()
+        index: Index = snapshot[2]
+
         # Validate the merge: True means invalid.
-        if self._validate_merge(target):
+        if self._validate_merge(target, snapshot):
             return
 
         # Get target branch's head commit id.
         target_commit_id = self.get_branch_head(target)
 
-        # Get each branch's history and validate.
-        current_history: list = self._history(self.head_commit_id())
-        target_history: list = self._history(target_commit_id)
-        if self._validate_history(target_commit_id, current_history, target_history):
+        # Find most recent common ancestor and validate.
+        head_id: str = self.head_commit_id()
+        split_id: str = self._find_split(head_id, target_commit_id)
+        if self._validate_history(head_id, target_commit_id, split_id, index):
             return
-
-        # Find most recent common ancestor.
-        split_id: str = self._find_split(current_history, target_history)
         if split_id == "":
             print("No common ancestor found.")
             return
 
+        # The blobs of the three commits are looked up once and shared by
+        # the steps below, none of which modify them.
+        blobs: MergeBlobs = (
+            snapshot[1],
+            self.load_commit(target_commit_id).blobs,
+            self.load_commit(split_id).blobs,
+        )
+
         # Populate the staging area for the merge commit, and checkout
         # files as necessary. Returns a list of merge conflicts.
-        conflicts: list[str] = self._prepare_merge(target_commit_id, split_id)
+        conflicts: list[str] = self._prepare_merge(blobs, index)
 
+        merge_message = f"Merged {target} into {self.current_branch()}"
         if conflicts:
-            self._merge_conflict(conflicts, target)
+            self._merge_conflict(conflicts, merge_message, target_commit_id, blobs)
         else:
-            merge_message = f"Merged {target} into {self.current_branch()}"
-            self.new_commit(self.head_commit_id(), merge_message, target_commit_id)
+            self.new_commit(head_id, merge_message, target_commit_id, index)
             print(merge_message)
 
-    def _validate_merge(self, target: str) -> bool:
+    def _validate_merge(self, target: str, snapshot: Snapshot) -> bool:
         """Error checking for merge method. Returns True if invalid.
 
         Unlike Gitlet, Gitlepy does not overwrite untracked files during
@@ -577,7 +734,7 @@ class Repo:
         in the way of a merge.
         """
         # Check for unstaged modifications files.
-        if self.unstaged_modifications():
+        if self.unstaged_modifications(snapshot):
             print(
                 "There is a file with unstaged changes;" +
                 " delete it, or add and commit it first."
@@ -585,7 +742,7 @@ class Repo:
             return True
 
         # Check whether staging area is clear.
-        index: Index = self.load_index()
+        index: Index = snapshot[2]
         if index.additions or index.removals:
             print("You have uncommitted changes.")
             return True
@@ -608,23 +765,24 @@ class Repo:
         this method uses a queue to interlink divergent branch histories.
         """
         history = []
-        q: SimpleQueue = SimpleQueue()
-        q.put(head_id)
+        seen: set[str] = set()  # mirrors history for constant-time lookups
+        q: deque[str] = deque([head_id])
 
-        while not q.empty():
-            current_id = q.get()
-            if current_id not in history:
+        while q:
+            current_id = q.popleft()
+            if current_id not in seen:
+                seen.add(current_id)
                 history.append(current_id)
                 current_commit: Commit = self.load_commit(current_id)
                 if current_commit.parent_two:
-                    q.put(current_commit.parent_two)
+                    q.append(current_commit.parent_two)
                 if current_commit.parent_one:
-                    q.put(current_commit.parent_one)
+                    q.append(current_commit.parent_one)
 
         return history
 
     def _validate_history(
-        self, target_head: str, current_history: list[str], target_history: list[str]
+        self, head_id: str, target_head: str, split_id: str, index: Index
     ) -> bool:
         """Returns True if merge should be cancelled. First checks whether the
         target branch is an unmodified ancestor of the current branch. If the
@@ -632,41 +790,100 @@ class Repo:
         branch is fast-forwarded by checking out the target branch.
 
         Args:
+            head_id: head commit id of the currently checked out branch.
             target_head: head commit id of the branch being merged.
-            current_history: commit history of the currently checked out branch.
-            target_history: commit history of the branch being merged.
+            split_id: most recent common ancestor of the two.
+            index: Staging area, cleared if fast-forwarding.
         """
-        if target_head in current_history:
+        if split_id == target_head:
             print("Target branch is an ancestor of the current branch.")
             return True
-        if self.head_commit_id() in target_history:
+        if split_id == head_id:
             print("Current branch is fast-forwarded.")
-            self._checkout_commit(self.head_commit_id(), target_head)
+            self._checkout_commit(head_id, target_head, index)
             return True
         return False
 
-    def _find_split(self, current_history: list[str], target_history: list[str]) -> str:
+    def _find_split(self, head_id: str, target_id: str) -> str:
         """Returns the most recent common ancestor of the two specified
-        commit histories.
-        """
-        for id in target_history:
-            if id in current_history:
-                return id
+        commits, or an empty string if their histories are disjoint.
 
-        return ""
+        Every commit that _mark_ancestors() finds reachable from both, and
+        not already stale, is a candidate. Merge commits can leave more than
+        one, in which case any that is an ancestor of another is discarded.
+        """
+        if head_id == target_id:
+            return head_id
+        candidates = [
+            commit_id
+            for commit_id, mark in self._mark_ancestors(head_id, target_id).items()
+            if mark & (FROM_BOTH | STALE) == FROM_BOTH
+        ]
+        if len(candidates) > 1:
+            candidates = self._drop_ancestors(candidates)
+        return candidates[0] if candidates else ""
+
+    def _mark_ancestors(self, head_id: str, target_id: str) -> Dict[str, int]:
+        """Returns the marks left on the ancestors of the two commits by a
+        search that stops short of walking both histories in full.
+
+        It searches breadth-first from both commits at once, marking each
+        commit with the side(s) that reached it. A commit reached from both
+        sides is a common ancestor, and its own ancestors are marked stale,
+        since none of them can be the most recent one. The search ends once
+        every queued commit is stale.
+        """
+        marks: Dict[str, int] = {head_id: FROM_HEAD, target_id: FROM_TARGET}
+        queue: deque[str] = deque([head_id, target_id])
+        queued: set[str] = {head_id, target_id}
+        active = 2  # Queued commits not yet marked stale.
+
+        while active:
+            commit_id = queue.popleft()
+            queued.discard(commit_id)
+            mark = marks[commit_id]
+            if not mark & STALE:
+                active -= 1
+            if mark & FROM_BOTH == FROM_BOTH:
+                mark |= STALE
+            commit: Commit = self.load_commit(commit_id)
+            for parent in (commit.parent_one, commit.parent_two):
+                if not parent:
+                    continue
+                old = marks.get(parent, 0)
+                new = old | mark
+                if new == old:
+                    continue
+                marks[parent] = new
+                # A commit gaining a mark is walked (again) to pass it on.
+                if parent not in queued:
+                    queue.append(parent)
+                    queued.add(parent)
+                    if not new & STALE:
+                        active += 1
+                elif new & STALE and not old & STALE:
+                    active -= 1
+
+        return marks
+
+    def _drop_ancestors(self, commit_ids: list[str]) -> list[str]:
+        """Returns the given commits, less any that is an ancestor of another."""
+        histories = {c: set(self._history(c)[1:]) for c in commit_ids}
+        return [
+            c for c in commit_ids if not any(c in histories[o] for o in commit_ids)
+        ]
 
-    def _prepare_merge(self, target_commit_id: str, split_id: str) -> list[str]:
+    def _prepare_merge(self, blobs: MergeBlobs, index: Index) -> list[str]:
         """Prepares the staging area for a merge commit and returns a list
         of conflicted files.
 
         Args:
-            target_commit_id: ID of the commit at the head of the branch to be merged.
-            split_id: ID of the most recent commont ancestor commit.
+            blobs: Blobs of the HEAD, target and split commits.
+            index: Staging area, shared by the helpers below and saved once
+                at the end.
         """
         conflicts: list[str] = []
-        head_blobs: Dict[str, str] = self.get_blobs(self.head_commit_id())
-        target_blobs: Dict[str, str] = self.get_blobs(target_commit_id)
-        split_blobs: Dict[str, str] = self.get_blobs(split_id)
+        head_blobs, target_blobs, split_blobs = blobs
 
         for filename in head_blobs:
             head_blob = head_blobs[filename]
@@ -678,6 +895,7 @@ class Repo:
                     head_blobs[filename],
                     target_blobs[filename],
                     split_blobs,
+                    index,
                 )
             elif filename in split_blobs:
                 # Not in target branch and present at split means
@@ -685,17 +903,18 @@ class Repo:
                 split_blob = split_blobs[filename]
                 # If unmodified in HEAD since split, then remove.
                 if head_blob == split_blob:
-                    index: Index = self.load_index()
                     index.remove(filename)
-                    index.save()
-                    Path(self.work_dir / filename).unlink()
-            # Remove file from target_blobs
-            target_blobs.pop(filename, None)
+                    (self.work_dir / filename).unlink()
 
         # Check files in target branch, which are not in current branch's HEAD.
-        # (I.e. all [filename, blob_id] pairs remaining.)
-        self._merge_target_blobs(target_blobs, split_blobs, target_commit_id)
+        target_only = {
+            filename: blob_id
+            for filename, blob_id in target_blobs.items()
+            if filename not in head_blobs
+        }
+        self._merge_target_blobs(target_only, split_blobs, index)
 
+        index.save()
         return conflicts
 
     def _merge_head_target(
@@ -705,11 +924,11 @@ class Repo:
         head_blob_id: str,
         target_blob_id: str,
         split_blobs: dict[str, str],
+        index: Index,
     ) -> None:
         """Helper method for _prepare_merge() that handles files tracked
         by both the current branch and the target branch.
         """
-        index: Index = self.load_index()
         # Check for file at split point
         if filename in split_blobs:
             split_blob_id: str = split_blobs[filename]
@@ -717,7 +936,6 @@ class Repo:
                 # Not modified in current HEAD -> keep target version.
                 if head_blob_id == split_blob_id:
                     index.stage(filename, target_blob_id)
-                    index.save()
                 # Modified in HEAD -> check for conflict.
                 elif head_blob_id != target_blob_id:
                     conflicts.append(filename)
@@ -728,194 +946,134 @@ class Repo:
         self,
         target_blobs: dict[str, str],
         split_blobs: dict[str, str],
-        target_commit_id: str,
+        index: Index,
     ) -> None:
-        index: Index = self.load_index()
+        """Helper method for _prepare_merge() that handles files tracked
+        only by the target branch.
+        """
         for filename in target_blobs:
             target_blob_id = target_blobs[filename]
             if filename not in split_blobs:  # Only present in target branch.
-                self.checkout_file(filename, target_commit_id)
+                blob = self.blobs_dir / target_blob_id
+                shutil.copyfile(blob, self.work_dir / filename)
                 index.stage(filename, target_blob_id)
             elif target_blob_id != split_blobs[filename]:
                 index.stage(filename, target_blob_id)
 
-        index.save()
-
-    def _merge_conflict(self, conflicts: list[str], target_branch: str) -> None:
-        """Resolves files in conflict by concatenating the two, stages them,
+    def _merge_conflict(
+        self,
+        conflicts: list[str],
+        merge_message: str,
+        target_id: str,
+        blobs: MergeBlobs,
+    ) -> None:
+        """Merges the lines of files changed in both branches, stages them,
         and then creates a merge commit.
+
+        Each file is merged line by line against its version at the split
+        point, and only the runs of lines changed differently in the two
+        branches are marked as conflicts.
+
+        Args:
+            conflicts: Names of the files changed in both branches.
+            merge_message: Message of the merge commit, printed if no
+                conflicts are left.
+            target_id: ID of the commit at the head of the branch being
+                merged.
+            blobs: Blobs of the HEAD, target and split commits.
         """
-        target_blobs: Dict[str, str] = self.get_blobs(
-            self.get_branch_head(target_branch)
-        )
+        head_blobs, target_blobs, split_blobs = blobs
+        index = self.load_index()
 
+        conflicted = False
         for filename in conflicts:
-            head_file = Path(self.work_dir / filename)
-            target_blob = Path(self.blobs_dir / target_blobs[filename])
+            head_file = self.work_dir / filename
+            target_blob = self.blobs_dir / target_blobs[filename]
+            base_blob = None
+            if filename in split_blobs:
+                base_blob = self.blobs_dir / split_blobs[filename]
 
-            self._write_conflict(
-                head_file, target_blob, self.get_branch_head(target_branch)
-            )
+            if self._write_conflict(head_file, target_blob, target_id, base_blob):
+                conflicted = True
 
-            self.add(filename)
+            # A clean merge can leave the file as it is in HEAD, in which
+            # case there is nothing to stage.
+            if self._blob_id(filename, index) != head_blobs[filename]:
+                self._stage_file(filename, index, head_blobs)
 
-        merge_message = f"Merged {self.current_branch()} into {target_branch}."
-        self.new_commit(
-            self.head_commit_id(), merge_message, self.get_branch_head(target_branch)
-        )
-        print("Encountered a merge conflict.")
-
-    def _write_conflict(self, head_file: Path, target_blob: Path, commit_id: str):
-        """Combines two files in conflict, writing to head_file.
-
-        With the head file as f1 and target file as f2:
-        0. Both line1 and line2 exist:
-        1. line1 == line2 -> copy as is
-        2. line1 != line2
-            ->  scan file_2 for matching line
-                2a. match found -> insertion: insert lines from file_2 until match
-                2b. no match -> Still could be a match in file_2 with remaining
-                                file_1 lines.
-                2b1. later match -> Start HEAD diff section, copy file_1 lines up
-                                   to matching line_1. Mid diff. Repeat for file_2
-                                   lines. Loop back to top, which will copy matched
-                                   lines.
-                2b2. never match -> Start HEAD diff section, copy remaining lines
-                                    from file_1, then split diff to remaining
-                                    lines in file_2, conclude with end of diff.
-
-        Clean up remaining lines:
-            1. If from file_1, then simply copy over.
-            2. If from file_2, then add an empty HEAD diff section before copying.
+        index.save()
+
+        self.new_commit(self.head_commit_id(), merge_message, target_id)
+        if conflicted:
+            print("Encountered a merge conflict.")
+        else:
+            print(merge_message)
+
+    def _write_conflict(
+        self,
+        head_file: Path,
+        target_blob: Path,
+        commit_id: str,
+        base_blob: Optional[Path] = None,
+    ) -> bool:
+        """Combines two files in conflict, writing to head_file. Returns True
+        if any lines were left in conflict.
+
+        Both files are read into lists of lines. Given the base_blob they
+        both descend from, they are merged with diff3 (see gitlepy.diff):
+        runs of lines changed on only one side, or the same way on both,
+        are merged cleanly. Without a base_blob, the two are aligned with a
+        patience diff and every run of lines not common to both is a
+        conflict. Each conflict becomes a diff section holding the lines
+        from head_file, then those from target_blob:
+
+            <<<<<<< HEAD
+            [head_file lines]
+            =======
+            [target_blob lines]
+            >>>>>>> [commit_id]
+
+        A run that only exists on one side leaves the other side's part of
+        the section empty.
         """
         start_diff = "<<<<<<< HEAD\n"
         mid_diff = "=======\n"
         end_diff = f">>>>>>> {commit_id}\n"
 
-        with head_file.open() as f1, target_blob.open() as f2, tempfile.NamedTemporaryFile(
-            mode="w+t", delete=False
-        ) as temp:
-            seek1 = f1.tell()  # starting positions
-            seek2 = f2.tell()
-            line1 = f1.readline()  # first lines
-            line2 = f2.readline()
-
-            while line1 and line2:
-                if line1 == line2:
-                    temp.write(line1)
-                else:  # Scan f2 for later match to line1
-                    skip = False  # For breaking out of top while loop
-                    while line2:
-                        line2 = f2.readline()
-                        if line1 == line2:
-                            # Match found -> insert lines from f2 until match.
-                            # First reset f2 to non-matching position.
-                            f2.seek(seek2)
-                            line2 = f2.readline()
-                            # Diff section for new f2 lines.
-                            temp.write(start_diff)
-                            temp.write(mid_diff)
-                            while line1 != line2:
-                                temp.write(line2)
-                                line2 = f2.readline()
-                            temp.write(end_diff)
-                            # Back to line1 == line2
-                            # Continue and let top of loop handle matching lines.
-                            skip = True
-                            break
-                    if skip:
-                        skip = False
-                        continue
-
-                    # No match to line1 found later in f2, check rest of f1 for
-                    # match with any remaining line in f2.
-                    f2.seek(seek2)  # First, reset f2 to previous position.
-                    line2 = f2.readline()
-                    match_byte = self._binsearch_lines(f1, f2)
-
-                    if match_byte > 0:  # Match in f1 found for line2.
-                        f1.seek(seek1)  # Reset position of f1.
-                        temp.write(start_diff)
-                        temp.write(f1.read(match_byte - seek1))  # copy up to match
-                        temp.write(mid_diff)
-                        # Get matching line from f1.
-                        seek1 = f1.tell()
-                        line1 = f1.readline()
-                        # Copy from f2 up to match.
-                        while line1 != line2:
-                            temp.write(line2)
-                            seek2 = f2.tell()
-                            line2 = f2.readline()
-                        temp.write(end_diff)
-                        # Back to line1 == line2
-                        continue
-                    else:  # No more matching lines. Finish diff.
-                        temp.write(start_diff)
-                        f1.seek(seek1)
-                        f2.seek(seek2)
-                        temp.write(f1.read())
-                        temp.write(mid_diff)
-                        temp.write(f2.read())
-                        temp.write(end_diff)
-                        # Advance lines so avoid extraneous writing.
-                        line1 = f1.readline()
-                        line2 = f2.readline()
-                        break
-
-                # Advance to next line, recording its starting position.
-                seek1 = f1.tell()
-                seek2 = f2.tell()
-                line1 = f1.readline()
-                line2 = f2.readline()
-
-            # Outside of main while loop.
-            # Include trailing lines if any remain.
-            if line1:
-                temp.write(line1)
-                while line1:
-                    line1 = f1.readline()
-                    temp.write(line1)
-            elif line2:
-                temp.write(start_diff)
-                temp.write(mid_diff)
-                temp.write(line2)
-                while line2:
-                    line2 = f1.readline()
-                    temp.write(line2)
-                temp.write(end_diff)
-
-        shutil.copy(temp.name, head_file)
-        remove(temp.name)
-
-    def _binsearch_lines(self, f1, f2) -> int:
-        """Returns the byte location of a matching line in f1 if it exists."""
-        # Sort remaining lines in file 2.
-        seek2 = f2.tell()
-        sorted_f2 = sorted(f2.readlines())  # sort remaining lines in f2
-        f2.seek(seek2)  # reset position of f2
-
-        # Iterate over remainig lines in file 1, searching for match in file 2.
-        seek1 = f1.tell()
-        line = f1.readline()
-        while line:
-            # When a match is found, return the byte position of the f1 line.
-            if self._binsearch(line, sorted_f2):
-                return seek1
-            seek1 = f1.tell()
-            line = f1.readline()
-
-        return 0
-
-    def _binsearch(self, line: str, all_lines: list[str]) -> bool:
-        """Helper function for binsearch_lines."""
-        if len(all_lines) - 1 >= 0:
-            mid: int = (len(all_lines) - 1) // 2
-
-            if line == all_lines[mid]:
-                return True
-            elif line < all_lines[mid]:
-                return self._binsearch(line, all_lines[:mid])
-            elif line > all_lines[mid]:
-                return self._binsearch(line, all_lines[mid + 1:])
-
-        return False
+        head_lines = head_file.read_text("utf-8").splitlines(keepends=True)
+        target_lines = target_blob.read_text("utf-8").splitlines(keepends=True)
+        if base_blob is None:
+            chunks: List[Chunk] = [
+                ("merged", head_lines[i1:i2], head_lines[i1:i2])
+                if tag == "equal"
+                else ("conflict", head_lines[i1:i2], target_lines[j1:j2])
+                for tag, i1, i2, j1, j2 in patience_opcodes(head_lines, target_lines)
+            ]
+        else:
+            base_lines = base_blob.read_text("utf-8").splitlines(keepends=True)
+            chunks = diff3_chunks(base_lines, head_lines, target_lines)
+
+        output: list[str] = []
+        conflicted = False
+        for tag, ours, theirs in chunks:
+            if tag == "merged":
+                output.extend(ours)
+            else:
+                conflicted = True
+                output.append(start_diff)
+                output.extend(self._terminate_lines(list(ours)))
+                output.append(mid_diff)
+                output.extend(self._terminate_lines(list(theirs)))
+                output.append(end_diff)
+
+        # Replace the working file in one step rather than rewriting it.
+        atomic_write(head_file, "".join(output).encode("utf-8"))
+        return conflicted
+
+    def _terminate_lines(self, lines: list[str]) -> list[str]:
+        """Ensures the last of the lines ends with a newline, so that a diff
+        section's marker always starts on a line of its own.
+        """
+        if lines and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        return lines
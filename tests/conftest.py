@@ -1,5 +1,6 @@
 from pathlib import Path
 import os.path
+import shutil
 
 from click.testing import CliRunner
 import pytest
@@ -26,14 +27,26 @@ def runner():
     return CliRunner()
 
 
+@pytest.fixture(scope="session")
+def repo_template(runner, tmp_path_factory):
+    """Initializes a Gitlepy repository once per test session.
+
+    Returns the path of its .gitlepy directory, which setup_repo copies into
+    each test's directory instead of running `gitlepy init` every time.
+    """
+    template = tmp_path_factory.mktemp("_template")
+    runner.invoke(main, ["--repo-home", str(template), "init"])
+    return template / ".gitlepy"
+
+
 @pytest.fixture()
-def setup_repo(runner):
+def setup_repo(repo_template):
     """Initializes a Gitlepy repository.
 
     The temporary file structure implemented by pytest can be accessed
     via setup_repo["work_path"] for example.
     """
-    runner.invoke(main, ["init"])
+    shutil.copytree(repo_template, Path(os.path.abspath(".")) / ".gitlepy")
     repo_paths = {}
     repo_paths["work_path"] = Path(os.path.abspath("."))
     repo_paths["test_path"] = Path(repo_paths["work_path"] / ".gitlepy")
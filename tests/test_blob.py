@@ -0,0 +1,18 @@
+"""tests/test_blob.py
+
+Tests the Blob class.
+"""
+from hashlib import sha1
+
+import pytest
+
+from gitlepy.blob import Blob
+
+
+@pytest.mark.parametrize("contents", [b"", b"hello\n", bytes(range(256)) * 2049])
+def test_blob_id(tmp_path, contents):
+    """Names a blob by the SHA-1 hash of the file's raw contents."""
+    filepath = tmp_path / "a.txt"
+    filepath.write_bytes(contents)
+    assert Blob(filepath).id == sha1(contents).hexdigest()
+    assert Blob(str(filepath)).id == sha1(contents).hexdigest()
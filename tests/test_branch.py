@@ -51,3 +51,16 @@ def test_branch_delete_current(runner, setup_repo):
     """Tries to delete currently checked out branch."""
     result = runner.invoke(main, ["branch", "-d", "main"])
     assert result.output == "Cannot delete currently checked out branch.\n"
+
+
+def test_branches_cached(runner, setup_repo):
+    """Memoizes the list of branches only within Repo.cached()."""
+    r = repository.Repo(setup_repo["work_path"])
+    with r.cached():
+        assert r.branches() == ["main"]
+        Path(setup_repo["branches"] / "dev").touch()
+        assert r.branches() == ["main"]
+        r.update_branch_head("fix", r.head_commit_id())
+        assert sorted(r.branches()) == ["dev", "fix", "main"]
+    Path(setup_repo["branches"] / "fix").unlink()
+    assert sorted(r.branches()) == ["dev", "main"]
@@ -3,10 +3,10 @@
 Tests the commit command.
 """
 from pathlib import Path
-import pickle
 import shutil
 
 from gitlepy.__main__ import main
+from gitlepy.commit import Commit
 from gitlepy.repository import Repo
 
 
@@ -58,6 +58,31 @@ def test_head_update(runner, setup_repo):
     assert new_head_id != init_commit_id
 
 
+def test_load_commit_cached(runner, setup_repo):
+    """Loads each commit object from disk only once per Repo."""
+    repo = Repo(setup_repo["work_path"])
+    commit_id = repo.head_commit_id()
+    commit = repo.load_commit(commit_id)
+    assert repo.load_commit(commit_id) is commit
+    # Callers get their own copy of the blobs to modify.
+    blobs = repo.get_blobs(commit_id)
+    blobs["a.txt"] = "abc"
+    assert "a.txt" not in commit.blobs
+
+
+def test_head_update_cached(setup_repo):
+    """Keeps the memoized HEAD commit in step with new commits."""
+    repo = Repo(setup_repo["work_path"])
+    with repo.cached():
+        init_commit_id = repo.head_commit_id()
+        Path("a.txt").write_text("hi")
+        repo.add("a.txt")
+        repo.new_commit(init_commit_id, "hi > a.txt")
+        new_head_id = repo.head_commit_id()
+    assert new_head_id != init_commit_id
+    assert new_head_id == Path(setup_repo["branches"] / "main").read_text()
+
+
 def test_commit_removals(runner, setup_repo):
     """Commits a removed file."""
     file_a = Path("a.txt")
@@ -140,9 +165,7 @@ def test_log(runner, setup_repo):
 
 def get_timestamp(c_path: Path) -> str:
     """Retrieves the timestamp of the Commit object with the given id."""
-    with c_path.open("rb") as f:
-        c = pickle.load(f)
-    return c.timestamp
+    return Commit.load(c_path).timestamp
 
 
 def test_commit_folder_deleted(runner, setup_repo):
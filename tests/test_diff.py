@@ -0,0 +1,97 @@
+"""tests/test_diff.py
+
+Tests the line-level diff used to write merge conflicts.
+"""
+import random
+
+from gitlepy.diff import diff3_chunks, patience_opcodes
+
+
+def apply_opcodes(a, b, opcodes):
+    """Rebuilds b from a and the opcodes, checking that equal runs match."""
+    out = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+            out.extend(a[i1:i2])
+        else:
+            out.extend(b[j1:j2])
+    return out
+
+
+def test_identical():
+    """Identical files form a single equal run."""
+    a = ["one\n", "two\n", "three\n"]
+    assert patience_opcodes(a, list(a)) == [("equal", 0, 3, 0, 3)]
+
+
+def test_empty():
+    """Diffs against an empty file are a single insert or delete."""
+    a = ["one\n", "two\n"]
+    assert patience_opcodes([], []) == []
+    assert patience_opcodes([], a) == [("insert", 0, 0, 0, 2)]
+    assert patience_opcodes(a, []) == [("delete", 0, 2, 0, 0)]
+
+
+def test_unique_lines_anchor():
+    """Matches on unique lines rather than on repeated ones, such as braces."""
+    a = ["f() {\n", "  x\n", "}\n", "g() {\n", "  y\n", "}\n"]
+    b = ["g() {\n", "  y\n", "}\n", "h()\n"]
+    assert patience_opcodes(a, b) == [
+        ("delete", 0, 3, 0, 0),
+        ("equal", 3, 6, 0, 3),
+        ("insert", 6, 6, 3, 4),
+    ]
+
+
+def test_random_round_trip():
+    """The opcodes always describe how to turn one file into the other."""
+    rng = random.Random(0)
+    for _ in range(200):
+        a = [rng.choice("abcde") + "\n" for _ in range(rng.randrange(20))]
+        b = [rng.choice("abcde") + "\n" for _ in range(rng.randrange(20))]
+        opcodes = patience_opcodes(a, b)
+        assert apply_opcodes(a, b, opcodes) == b
+        # Runs are contiguous and cover both files.
+        assert [op[1] for op in opcodes[1:]] == [op[2] for op in opcodes[:-1]]
+        assert [op[3] for op in opcodes[1:]] == [op[4] for op in opcodes[:-1]]
+        if opcodes:
+            assert opcodes[-1][2] == len(a) and opcodes[-1][4] == len(b)
+
+
+def test_diff3_one_side_changed():
+    """Takes the changes made on either side when they do not overlap."""
+    base = ["one\n", "two\n", "three\n", "four\n"]
+    ours = ["1\n", "two\n", "three\n", "four\n"]
+    theirs = ["one\n", "two\n", "three\n", "4\n", "five\n"]
+    chunks = diff3_chunks(base, ours, theirs)
+    assert all(tag == "merged" for tag, _, _ in chunks)
+    assert [line for _, lines, _ in chunks for line in lines] == [
+        "1\n",
+        "two\n",
+        "three\n",
+        "4\n",
+        "five\n",
+    ]
+
+
+def test_diff3_conflict():
+    """Marks a run of lines changed differently on both sides."""
+    base = ["one\n", "two\n", "three\n"]
+    ours = ["one\n", "2\n", "three\n"]
+    theirs = ["one\n", "II\n", "three\n"]
+    assert diff3_chunks(base, ours, theirs) == [
+        ("merged", ["one\n"], ["one\n"]),
+        ("conflict", ["2\n"], ["II\n"]),
+        ("merged", ["three\n"], ["three\n"]),
+    ]
+
+
+def test_diff3_same_change():
+    """Merges a run of lines changed the same way on both sides."""
+    base = ["one\n", "two\n"]
+    ours = ["one\n", "2\n"]
+    assert diff3_chunks(base, ours, list(ours)) == [
+        ("merged", ["one\n"], ["one\n"]),
+        ("merged", ["2\n"], ["2\n"]),
+    ]
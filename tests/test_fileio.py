@@ -0,0 +1,68 @@
+"""tests/test_fileio.py
+
+Tests the helpers for writing repository files.
+"""
+import os
+from pathlib import Path
+
+import pytest
+
+from gitlepy.fileio import atomic_copy, atomic_write
+
+
+def test_atomic_write(tmp_path):
+    """Replaces a file's contents without leaving a temporary file behind."""
+    file_a = Path(tmp_path / "a.txt")
+    atomic_write(file_a, b"hello")
+    assert file_a.read_bytes() == b"hello"
+    atomic_write(file_a, b"world")
+    assert file_a.read_bytes() == b"world"
+    assert [p.name for p in tmp_path.iterdir()] == ["a.txt"]
+
+
+def test_atomic_write_failure(tmp_path):
+    """Leaves the original contents in place if the write fails."""
+    file_a = Path(tmp_path / "a.txt")
+    file_a.write_bytes(b"hello")
+    with pytest.raises(TypeError):
+        atomic_write(file_a, "not bytes")  # type: ignore[arg-type]
+    assert file_a.read_bytes() == b"hello"
+    assert [p.name for p in tmp_path.iterdir()] == ["a.txt"]
+
+
+def test_atomic_write_existing_temp_name(tmp_path):
+    """Leaves alone a file with the name of a fixed temporary file."""
+    file_a = Path(tmp_path / "a.txt")
+    file_tmp = Path(tmp_path / ".a.txt.tmp")
+    file_tmp.write_bytes(b"mine")
+    atomic_write(file_a, b"hello")
+    assert file_a.read_bytes() == b"hello"
+    assert file_tmp.read_bytes() == b"mine"
+    assert sorted(p.name for p in tmp_path.iterdir()) == [".a.txt.tmp", "a.txt"]
+
+
+def test_atomic_write_mode(tmp_path):
+    """Gives a new file the same mode as a file created with open()."""
+    file_a = Path(tmp_path / "a.txt")
+    file_b = Path(tmp_path / "b.txt")
+    atomic_write(file_a, b"hello")
+    file_b.write_bytes(b"hello")
+    assert os.stat(file_a).st_mode == os.stat(file_b).st_mode
+
+
+def test_atomic_copy(tmp_path):
+    """Copies a file without leaving a temporary file behind."""
+    file_a = Path(tmp_path / "a.txt")
+    file_a.write_bytes(b"hello")
+    file_b = Path(tmp_path / "b.txt")
+    atomic_copy(file_a, file_b)
+    assert file_b.read_bytes() == b"hello"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.txt", "b.txt"]
+
+
+def test_atomic_copy_failure(tmp_path):
+    """Leaves neither the destination nor a temporary file if the copy fails."""
+    file_b = Path(tmp_path / "b.txt")
+    with pytest.raises(FileNotFoundError):
+        atomic_copy(Path(tmp_path / "missing.txt"), file_b)
+    assert list(tmp_path.iterdir()) == []
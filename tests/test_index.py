@@ -1,7 +1,9 @@
 # tests/test_index.py
 """Tests the Index class."""
+import os
 from pathlib import Path
 import pickle
+import time
 
 
 from gitlepy.__main__ import main
@@ -44,14 +46,38 @@ def test_add(runner, setup_repo):
     result = runner.invoke(main, ["add", "a.txt"])
     assert result.output == ""
 
-    with open(setup_repo["index_path"], "rb") as file:
-        test_index: Index = pickle.load(file)
+    test_index: Index = Index.load(setup_repo["index_path"])
 
     assert repr(test_index) == "Index"
     assert len(test_index.additions) == 1
     assert "a.txt" in test_index.additions.keys()
 
 
+def test_add_blob_contents(runner, setup_repo):
+    """Stores a staged file's blob as the raw contents of the file."""
+    file_a = Path("a.txt")
+    file_a.write_bytes(b"hello\x00world\n")
+    runner.invoke(main, ["add", "a.txt"])
+    repo = Repo(setup_repo["work_path"])
+    blob_id = repo.load_index().additions["a.txt"]
+    assert repo.load_blob(blob_id) == b"hello\x00world\n"
+
+
+def test_add_existing_blob(runner, setup_repo):
+    """Does not rewrite a blob that is already stored."""
+    file_a = Path("a.txt")
+    file_a.write_text("hello")
+    file_b = Path("b.txt")
+    file_b.write_text("hello")
+    runner.invoke(main, ["add", "a.txt"])
+    repo = Repo(setup_repo["work_path"])
+    blob_path = setup_repo["blobs_path"] / repo.load_index().additions["a.txt"]
+    os.utime(blob_path, ns=(0, 0))
+    runner.invoke(main, ["add", "b.txt"])
+    assert repo.load_index().additions["b.txt"] == blob_path.name
+    assert blob_path.stat().st_mtime_ns == 0
+
+
 def test_rm_none(runner, setup_repo):
     """Tries to remove an untracked, unstaged file."""
     file_a = Path("a.txt")
@@ -113,6 +139,26 @@ def test_rm_already_staged_removal(runner, setup_repo):
     assert result.output == expected
 
 
+def test_add_many(runner, setup_repo):
+    """Stages several files with a single command."""
+    Path("a.txt").write_text("a")
+    Path("b.txt").write_text("b")
+    result = runner.invoke(main, ["add", "a.txt", "b.txt"])
+    assert result.exit_code == 0
+    index = Repo(setup_repo["work_path"]).load_index()
+    assert index.additions.keys() == {"a.txt", "b.txt"}
+
+
+def test_add_many_no_file(runner, setup_repo):
+    """Stages nothing if any of the files does not exist."""
+    Path("a.txt").write_text("a")
+    result = runner.invoke(main, ["add", "a.txt", "nofile"])
+    assert result.exit_code == 1
+    assert result.output == "nofile does not exist.\n"
+    index = Repo(setup_repo["work_path"]).load_index()
+    assert index.additions == {}
+
+
 def test_add_revert_add(runner, setup_repo):
     """Stages a file, then changes it to original state and adds, which
     unstages the file.
@@ -131,3 +177,87 @@ def test_add_revert_add(runner, setup_repo):
     repo = Repo(setup_repo["work_path"])
     index = repo.load_index()
     assert "a.txt" not in index.additions.keys()
+
+
+def test_add_stat_cache(runner, setup_repo, monkeypatch):
+    """Reuses the blob ID of a file whose stat is unchanged."""
+    monkeypatch.setattr("gitlepy.index.RACY_NS", 0)  # trust any timestamps
+    file_a = Path("a.txt")
+    file_a.write_text("hello")
+    runner.invoke(main, ["add", "a.txt"])
+    repo = Repo(setup_repo["work_path"])
+    index = repo.load_index()
+    blob_id = index.additions["a.txt"]
+    st = file_a.stat()
+    expected = (5, st.st_mtime_ns, st.st_ctime_ns, st.st_ino, blob_id)
+    assert index.stat_cache["a.txt"] == expected
+
+    # Same stat: the file is not hashed again.
+    monkeypatch.setattr("gitlepy.repository.Blob", None)
+    result = runner.invoke(main, ["add", "a.txt"])
+    assert result.output == "File is already staged in present state.\n"
+
+
+def test_add_stat_cache_same_mtime(runner, setup_repo, monkeypatch):
+    """Rehashes a file edited in place with its size and mtime kept, whose
+    ctime has changed.
+    """
+    monkeypatch.setattr("gitlepy.index.RACY_NS", 0)  # trust any timestamps
+    file_a = Path("a.txt")
+    file_a.write_text("hello")
+    os.utime(file_a, ns=(0, 0))
+    runner.invoke(main, ["add", "a.txt"])
+    time.sleep(0.05)  # let the kernel's coarse clock tick for the ctime
+    file_a.write_text("world")
+    os.utime(file_a, ns=(0, 0))
+    result = runner.invoke(main, ["add", "a.txt"])
+    assert result.output == ""
+    repo = Repo(setup_repo["work_path"])
+    assert repo.load_blob(repo.load_index().additions["a.txt"]) == b"world"
+
+
+def test_add_stat_cache_replaced(runner, setup_repo, monkeypatch):
+    """Rehashes a file replaced by another of the same size and mtime."""
+    monkeypatch.setattr("gitlepy.index.RACY_NS", 0)  # trust any timestamps
+    file_a = Path("a.txt")
+    file_a.write_text("hello")
+    os.utime(file_a, ns=(0, 0))
+    runner.invoke(main, ["add", "a.txt"])
+    file_b = Path("b.txt")
+    file_b.write_text("world")
+    os.utime(file_b, ns=(0, 0))
+    os.replace(file_b, file_a)
+    result = runner.invoke(main, ["add", "a.txt"])
+    assert result.output == ""
+    repo = Repo(setup_repo["work_path"])
+    assert repo.load_blob(repo.load_index().additions["a.txt"]) == b"world"
+
+
+def test_add_stat_cache_racy(runner, setup_repo):
+    """Does not cache the blob ID of a file changed moments ago, even if its
+    mtime has been set back.
+    """
+    file_a = Path("a.txt")
+    file_a.write_text("hello")
+    runner.invoke(main, ["add", "a.txt"])
+    index = Repo(setup_repo["work_path"]).load_index()
+    assert "a.txt" not in index.stat_cache
+
+    os.utime(file_a, ns=(0, 0))
+    runner.invoke(main, ["add", "a.txt"])
+    index = Repo(setup_repo["work_path"]).load_index()
+    assert "a.txt" not in index.stat_cache
+
+
+def test_load_legacy_index(setup_repo):
+    """Reads an index pickled by an earlier version of gitlepy."""
+    legacy = Index(setup_repo["index_path"], {"a.txt": "abc"}, set())
+    del legacy.stat_cache
+    setup_repo["index_path"].write_bytes(pickle.dumps(legacy))
+    index = Index.load(setup_repo["index_path"])
+    assert index.additions == {"a.txt": "abc"}
+    assert index.stat_cache == {}
+    # Saving it again converts it to the current format.
+    index.save()
+    assert setup_repo["index_path"].read_bytes().startswith(b"{")
+    assert Index.load(setup_repo["index_path"]).additions == {"a.txt": "abc"}
@@ -7,9 +7,9 @@ points to the initial commit.
 """
 import os.path
 from pathlib import Path
-import pickle
 
 
+from gitlepy.commit import Commit
 from gitlepy.index import Index
 from gitlepy.__main__ import main
 
@@ -31,19 +31,17 @@ def test_main_init_new_repo(runner):
     assert Path(test_path / "refs").exists()
     assert Path(test_path / "index").exists()
 
-    with index_path.open("rb") as file:
-        test_index: Index = pickle.load(file)
-        assert repr(test_index) == "Index"
+    test_index: Index = Index.load(index_path)
+    assert repr(test_index) == "Index"
 
     # Get name of commit object file. There should be only one.
     all_commits = list(Path(test_path / "commits").iterdir())
     assert len(all_commits) == 1
     commit_file = all_commits[0]
-    # Open it and unpickle it.
-    with commit_file.open("rb") as file:
-        test_commit = pickle.load(file)
-        assert repr(test_commit) == "Commit"
-        assert test_commit.message == "Initial commit."
+    # Open it and load it.
+    test_commit = Commit.load(commit_file)
+    assert repr(test_commit) == "Commit"
+    assert test_commit.message == "Initial commit."
 
     main_branch = Path(Path(test_path / "refs") / "main")
     assert main_branch.exists()
@@ -2,17 +2,19 @@
 
 Tests the merge command.
 """
-from pathlib import Path
+import shutil
+from types import SimpleNamespace
 
 import pytest
 
 from gitlepy.__main__ import main
+from gitlepy.commit import Commit
 from gitlepy.repository import Repo
 
 
-@pytest.fixture(autouse=True)
-def merge_setup(runner, setup_repo):
-    """Basic multi-branch setup for merge tests.
+@pytest.fixture(scope="session")
+def merge_template(repo_template, tmp_path_factory):
+    """Basic multi-branch setup for merge tests, built once per session.
 
     Leaves the gitlepy repository in the following state, with a working
     directory clear of unstaged modifications:
@@ -23,22 +25,53 @@ def merge_setup(runner, setup_repo):
     main's a.txt = "Hello"
     dev's a.txt = "Hello, gitlepy.\n"
     """
-    file_a = Path(setup_repo["work_path"] / "a.txt")
+    work_path = tmp_path_factory.mktemp("_merge_template")
+    shutil.copytree(repo_template, work_path / ".gitlepy")
+
+    # Built through the Repo API, as only the merge command is under test.
+    repo = Repo(work_path)
+    file_a = work_path / "a.txt"
     file_a.write_text("Hello")
-    runner.invoke(main, ["add", "a.txt"])
-    runner.invoke(main, ["commit", "Hello > a.txt"])
+    repo.add("a.txt")
+    repo.new_commit(repo.head_commit_id(), "Hello > a.txt")
 
-    runner.invoke(main, ["branch", "dev"])  # create branch called dev
-    runner.invoke(main, ["checkout", "dev"])  # check out dev
+    repo.update_branch_head("dev", repo.head_commit_id())  # create branch dev
+    repo.checkout_branch("dev")  # check out dev
     file_a.write_text("Hello, gitlepy.\n")
-    runner.invoke(main, ["add", "a.txt"])
-    runner.invoke(main, ["commit", "Hello, gitlepy > a.txt"])
+    repo.add("a.txt")
+    repo.new_commit(repo.head_commit_id(), "Hello, gitlepy > a.txt")
+    return work_path
 
 
-def test_merge_uncommited_changes(runner, setup_repo):
+@pytest.fixture(autouse=True)
+def merge_setup(merge_template, tmp_path):
+    """Copies the repository built by merge_template into the test's
+    working directory and returns its path.
+    """
+    shutil.copytree(merge_template, tmp_path, dirs_exist_ok=True)
+    return tmp_path
+
+
+@pytest.fixture()
+def paths(merge_setup):
+    """Paths within the test repository, joined once per test."""
+    work_path = merge_setup
+    gitlepy_path = work_path / ".gitlepy"
+    return SimpleNamespace(
+        work_path=work_path,
+        file_a=work_path / "a.txt",
+        file_b=work_path / "b.txt",
+        file_c=work_path / "c.txt",
+        blobs=gitlepy_path / "blobs",
+        branches=gitlepy_path / "refs",
+        head=gitlepy_path / "HEAD",
+    )
+
+
+def test_merge_uncommited_changes(runner, paths):
     """Fails to merge due to staged but uncommited changes."""
     runner.invoke(main, ["checkout", "main"])
-    file_a = Path(setup_repo["work_path"] / "a.txt")
+    file_a = paths.file_a
     file_a.write_text("Hi\n")
     runner.invoke(main, ["add", "a.txt"])  # stage file_a
     result = runner.invoke(main, ["merge", "dev"])
@@ -46,19 +79,19 @@ def test_merge_uncommited_changes(runner, setup_repo):
     assert expected == result.output
 
 
-def test_merge_unstaged_changes(runner, setup_repo):
+def test_merge_unstaged_changes(runner, paths):
     """Merges a file with unstaged changes."""
     runner.invoke(main, ["checkout", "main"])
-    file_a = Path(setup_repo["work_path"] / "a.txt")
+    file_a = paths.file_a
     file_a.write_text("Hi\n")
     result = runner.invoke(main, ["merge", "dev"])
     expected = "There is a file with unstaged changes; delete it, or add and commit it first.\n"
     assert result.output == expected
 
 
-def test_merge_nonexistent_branch(runner, setup_repo):
+def test_merge_nonexistent_branch(runner, paths):
     """Tries to merge with a branch name that does not exist."""
-    r = Repo(setup_repo["work_path"])
+    r = Repo(paths.work_path)
     result = r.branches()
     assert len(result) == 2
     assert "main" in result
@@ -70,28 +103,28 @@ def test_merge_nonexistent_branch(runner, setup_repo):
     assert expected == result.output
 
 
-def test_merge_self(runner, setup_repo):
+def test_merge_self(runner):
     """Tries to merge a branch with itself."""
     result = runner.invoke(main, ["merge", "dev"])
     expected = "Cannot merge a branch with itself.\n"
     assert expected == result.output
 
 
-def test_merge_file_change(runner, setup_repo):
+def test_merge_file_change(runner, paths):
     """Fast forwards main to dev."""
     runner.invoke(main, ["checkout", "main"])
     merge_result = runner.invoke(main, ["merge", "dev"])
     merge_expected = "Current branch is fast-forwarded.\n"
     assert merge_expected == merge_result.output
-    file_a = Path(setup_repo["work_path"] / "a.txt")
+    file_a = paths.file_a
     expected = "Hello, gitlepy.\n"
     assert file_a.read_text() == expected
 
 
-def test_merge_head_updated(runner, setup_repo):
+def test_merge_head_updated(runner, paths):
     """Fast forwards main to dev and checks that the HEAD reference
     for main branch is the same as dev branch."""
-    repo = Repo(setup_repo["work_path"])
+    repo = Repo(paths.work_path)
     dev_ref = repo.head_commit_id()
 
     # checkout main
@@ -107,19 +140,141 @@ def test_merge_head_updated(runner, setup_repo):
     assert new_main_ref == dev_ref
 
 
-def test_merge_ignore_untracked_file(runner, setup_repo):
+def test_merge_ancestor(runner):
+    """Tries to merge a branch whose head is already in the current history."""
+    result = runner.invoke(main, ["merge", "main"])
+    expected = "Target branch is an ancestor of the current branch.\n"
+    assert expected == result.output
+
+
+def test_find_split(runner, paths):
+    """Finds the commit at which main and dev diverged."""
+    repo = Repo(paths.work_path)
+    split_id = repo.get_branch_head("main")
+    runner.invoke(main, ["checkout", "main"])
+    file_b = paths.file_b
+    file_b.write_text("main text")
+    runner.invoke(main, ["add", "b.txt"])
+    runner.invoke(main, ["commit", "main text > b.txt"])
+    main_id = repo.get_branch_head("main")
+    dev_id = repo.get_branch_head("dev")
+    assert repo._find_split(main_id, dev_id) == split_id
+    assert repo._find_split(dev_id, main_id) == split_id
+    assert repo._find_split(split_id, dev_id) == split_id
+
+
+def save_commit(repo, parent, message, merge_parent=None):
+    """Saves a commit tracking the same files as its first parent and
+    returns its ID, so that commit graphs can be built without staging.
+    """
+    commit = Commit(parent, message, merge_parent)
+    commit.blobs = repo.get_blobs(parent)
+    repo._save_commit(commit)
+    return commit.commit_id
+
+
+@pytest.fixture()
+def merge_graph(paths):
+    r"""Checks out main and builds the following history, in which side's
+    head is a merge commit whose second parent descends from main's head:
+
+        G --- H (main) --- X
+         \                  \
+          P ---------------- M (side)
+    """
+    repo = Repo(paths.work_path)
+    repo.checkout_branch("main")
+    ids = {"G": repo.head_commit_id()}
+    ids["H"] = save_commit(repo, ids["G"], "H")
+    ids["P"] = save_commit(repo, ids["G"], "P")
+    ids["X"] = save_commit(repo, ids["H"], "X")
+    ids["M"] = save_commit(repo, ids["P"], "M", ids["X"])
+    repo.update_branch_head("main", ids["H"])
+    repo.update_branch_head("side", ids["M"])
+    return ids
+
+
+def test_find_split_through_merge(paths, merge_graph):
+    """Finds main's head as the split point when side's history reaches it
+    through a merge commit, rather than the older common ancestor G.
+    """
+    repo = Repo(paths.work_path)
+    assert repo._find_split(merge_graph["H"], merge_graph["M"]) == merge_graph["H"]
+    assert repo._find_split(merge_graph["M"], merge_graph["H"]) == merge_graph["H"]
+
+
+def test_merge_ancestor_through_merge(runner, paths, merge_graph):
+    """Refuses to merge main into side, whose merge commit already includes it."""
+    paths.head.write_text("side")
+    result = runner.invoke(main, ["merge", "main"])
+    expected = "Target branch is an ancestor of the current branch.\n"
+    assert expected == result.output
+
+
+def test_merge_fast_forward_through_merge(runner, paths, merge_graph):
+    """Fast forwards main to side, whose merge commit descends from main's head."""
+    repo = Repo(paths.work_path)
+    commits = repo.commits()
+    result = runner.invoke(main, ["merge", "side"])
+    assert result.output == "Current branch is fast-forwarded.\n"
+    assert repo.get_branch_head("main") == merge_graph["M"]
+    assert repo.commits() == commits  # no merge commit made
+
+
+def test_find_split_best_candidate(paths):
+    """Picks the most recent of the common ancestors left by the search.
+
+    A <- A2 <- B is shared history. H's parents are B and A, and T's are
+    t1 and A, where t1 <- t2 <- B. Both heads reach A in one step, but the
+    search only reaches B from T three steps later, so both A and B are
+    left as candidates.
+    """
+    repo = Repo(paths.work_path)
+    a_id = save_commit(repo, repo.get_branch_head("main"), "A")
+    b_id = save_commit(repo, save_commit(repo, a_id, "A2"), "B")
+    head_id = save_commit(repo, b_id, "H", a_id)
+    t1_id = save_commit(repo, save_commit(repo, b_id, "t2"), "t1")
+    target_id = save_commit(repo, t1_id, "T", a_id)
+    assert repo._find_split(head_id, target_id) == b_id
+    assert repo._find_split(target_id, head_id) == b_id
+
+
+def test_find_split_loads(paths, monkeypatch):
+    """Loads only the commits down to the split point, not the whole shared
+    history beneath it.
+    """
+    repo = Repo(paths.work_path)
+    base_id = repo.get_branch_head("main")
+    for n in range(100):
+        base_id = save_commit(repo, base_id, f"shared {n}")
+    head_id = save_commit(repo, base_id, "head")
+    target_id = save_commit(repo, base_id, "target")
+
+    repo = Repo(paths.work_path)
+    loaded = []
+    load_commit = repo.load_commit
+    monkeypatch.setattr(
+        repo, "load_commit", lambda c: loaded.append(c) or load_commit(c)
+    )
+    assert repo._find_split(head_id, target_id) == base_id
+    assert len(loaded) == 3
+
+
+def test_merge_ignore_untracked_file(paths):
     """Fast forwards main to dev, ignoring an untracked file."""
-    file_b = Path(setup_repo["work_path"] / "b.txt")
+    repo = Repo(paths.work_path)
+    file_b = paths.file_b
     file_b.touch()
-    runner.invoke(main, ["checkout", "main"])
-    file_c = Path(setup_repo["work_path"] / "c.txt")
+    repo.checkout_branch("main")
+    file_c = paths.file_c
     file_c.touch()
-    runner.invoke(main, ["merge", "dev"])
+    repo.merge("dev")
+    assert repo.head_commit_id() == repo.get_branch_head("dev")
     assert file_b.exists()
     assert file_c.exists()
 
 
-def test_merge_file_conflict(runner, setup_repo):
+def test_merge_file_conflict(runner, paths):
     """Merges a file with a conflict.
 
     Checks out main and modifies a.txt to contain 'Hi'.
@@ -131,15 +286,15 @@ def test_merge_file_conflict(runner, setup_repo):
         Hello, gitlepy.
         >>>>>>> {head_dev_commit_id}
     """
-    repo = Repo(setup_repo["work_path"])
+    repo = Repo(paths.work_path)
     head_dev_commit_id = repo.head_commit_id()
-    assert Path(setup_repo["work_path"] / "a.txt").read_text() == "Hello, gitlepy.\n"
+    assert paths.file_a.read_text() == "Hello, gitlepy.\n"
     runner.invoke(main, ["checkout", "main"])
-    file_a = Path(setup_repo["work_path"] / "a.txt")
+    file_a = paths.file_a
     file_a.write_text("Hi\n")
     runner.invoke(main, ["add", "a.txt"])
     runner.invoke(main, ["commit", "Hi > a.txt"])
-    assert Path(setup_repo["work_path"] / "a.txt").read_text() == "Hi\n"
+    assert paths.file_a.read_text() == "Hi\n"
     result = runner.invoke(main, ["merge", "dev"])
     assert result.exit_code == 0
     assert result.output == "Encountered a merge conflict.\n"
@@ -149,14 +304,14 @@ def test_merge_file_conflict(runner, setup_repo):
     assert expected == file_a.read_text()
 
 
-def test_merge_no_split(runner, setup_repo):
+def test_merge_no_split(runner, paths):
     """Runs the Repo.merge method with disparate commit histories."""
-    repo = Repo(setup_repo["work_path"])
+    repo = Repo(paths.work_path)
 
     # Create a disconnected branch.
-    Path(setup_repo["branches"] / "fake")
+    paths.branches / "fake"
     # Force HEAD file to reference it
-    setup_repo["head"].write_text("fake")
+    paths.head.write_text("fake")
 
     assert repo.current_branch() == "fake"
 
@@ -168,10 +323,10 @@ def test_merge_no_split(runner, setup_repo):
     assert expected == result.output
 
 
-def test_merge_success(runner, setup_repo):
+def test_merge_success(runner, paths):
     """Merges two branches."""
     runner.invoke(main, ["checkout", "main"])
-    file_b = Path(setup_repo["work_path"] / "b.txt")
+    file_b = paths.file_b
     file_b.write_text("main text")
     runner.invoke(main, ["add", "b.txt"])
     runner.invoke(main, ["commit", "main text > b.txt"])
@@ -180,3 +335,111 @@ def test_merge_success(runner, setup_repo):
     expected = "Merged dev into main\n"
     assert merge_result.exit_code == 0
     assert expected == merge_result.output
+
+
+def three_way(runner, paths, ours, theirs):
+    """Commits b.txt with the lines "a", "x" and "b" on main, then commits
+    the given versions of it on main and on a new branch, other, and checks
+    out main.
+    """
+    repo = Repo(paths.work_path)
+    runner.invoke(main, ["checkout", "main"])
+    paths.file_b.write_text("a\nx\nb\n")
+    runner.invoke(main, ["add", "b.txt"])
+    runner.invoke(main, ["commit", "base > b.txt"])
+    repo.update_branch_head("other", repo.head_commit_id())
+    paths.file_b.write_text(ours)
+    runner.invoke(main, ["add", "b.txt"])
+    runner.invoke(main, ["commit", "ours > b.txt"])
+    runner.invoke(main, ["checkout", "other"])
+    paths.file_b.write_text(theirs)
+    runner.invoke(main, ["add", "b.txt"])
+    runner.invoke(main, ["commit", "theirs > b.txt"])
+    runner.invoke(main, ["checkout", "main"])
+    return repo
+
+
+def test_merge_clean_three_way(runner, paths):
+    """Merges the lines of a file changed in different places in both
+    branches, without conflict markers.
+    """
+    repo = three_way(runner, paths, "A\nx\nb\n", "a\nx\nB\n")
+    head_id = repo.head_commit_id()
+    other_id = repo.get_branch_head("other")
+    result = runner.invoke(main, ["merge", "other"])
+    assert result.exit_code == 0
+    assert result.output == "Merged other into main\n"
+    assert paths.file_b.read_text() == "A\nx\nB\n"
+    commit = repo.load_commit(repo.head_commit_id())
+    assert (commit.parent_one, commit.parent_two) == (head_id, other_id)
+    assert commit.message == "Merged other into main"
+    assert not repo.load_index().additions
+    assert repo.unstaged_modifications() == []
+
+
+def test_merge_same_as_head(runner, paths):
+    """Makes a merge commit when merging the lines of a file changed in both
+    branches leaves it as it is in HEAD.
+    """
+    repo = three_way(runner, paths, "A\nx\nB\n", "A\nx\nb\n")
+    head_id = repo.head_commit_id()
+    other_id = repo.get_branch_head("other")
+    result = runner.invoke(main, ["merge", "other"])
+    assert result.exit_code == 0
+    assert result.output == "Merged other into main\n"
+    assert paths.file_b.read_text() == "A\nx\nB\n"
+    commit = repo.load_commit(repo.head_commit_id())
+    assert (commit.parent_one, commit.parent_two) == (head_id, other_id)
+    assert commit.blobs == repo.get_blobs(head_id)
+
+
+def test_write_conflict_sections(paths):
+    """Keeps lines common to both files and marks only the runs that differ."""
+    repo = Repo(paths.work_path)
+    head_file = paths.file_c
+    head_file.write_text("one\ntwo\nthree\nfour")
+    target_file = paths.work_path / "d.txt"
+    target_file.write_text("one\n2\nthree\nfour\nfive\n")
+    repo._write_conflict(head_file, target_file, "abc")
+    expected = (
+        "one\n"
+        "<<<<<<< HEAD\ntwo\n=======\n2\n>>>>>>> abc\n"
+        "three\n"
+        "<<<<<<< HEAD\nfour\n=======\nfour\nfive\n>>>>>>> abc\n"
+    )
+    assert expected == head_file.read_text()
+
+
+def test_write_conflict_base(paths):
+    """Merges the lines changed on only one side since the base blob."""
+    repo = Repo(paths.work_path)
+    base_file = paths.work_path / "base.txt"
+    base_file.write_text("one\ntwo\nthree\nfour\n")
+    head_file = paths.file_c
+    head_file.write_text("1\ntwo\nthree\nfour\n")
+    target_file = paths.work_path / "d.txt"
+    target_file.write_text("one\ntwo\n3\nfour\n")
+    assert not repo._write_conflict(head_file, target_file, "abc", base_file)
+    assert head_file.read_text() == "1\ntwo\n3\nfour\n"
+
+    head_file.write_text("1\ntwo\nthree\nfour\n")
+    target_file.write_text("I\ntwo\n3\nfour\n")
+    assert repo._write_conflict(head_file, target_file, "abc", base_file)
+    expected = "<<<<<<< HEAD\n1\n=======\nI\n>>>>>>> abc\ntwo\n3\nfour\n"
+    assert expected == head_file.read_text()
+
+
+def test_write_conflict_temp_name(paths):
+    """Leaves alone a file in the working directory that has the name of a
+    fixed temporary file for the conflicted file.
+    """
+    repo = Repo(paths.work_path)
+    head_file = paths.file_c
+    head_file.write_text("one\n")
+    user_file = paths.work_path / ".c.txt.tmp"
+    user_file.write_text("mine\n")
+    target_file = paths.work_path / "d.txt"
+    target_file.write_text("1\n")
+    repo._write_conflict(head_file, target_file, "abc")
+    assert user_file.read_text() == "mine\n"
+    assert head_file.read_text() == "<<<<<<< HEAD\none\n=======\n1\n>>>>>>> abc\n"
@@ -1,6 +1,7 @@
 """Tests the status command as well as the Repo class's methods for
 determining untracked and modified files.
 """
+import os
 from pathlib import Path
 
 
@@ -14,7 +15,7 @@ def test_working_files(setup_repo):
     file_a = Path(setup_repo["work_path"] / "a.txt")
     file_a.touch()
     working_result = repo.working_files()
-    assert ["a.txt"] == working_result
+    assert {"a.txt"} == working_result
 
 
 def test_untracked_files(setup_repo):
@@ -106,6 +107,23 @@ def test_unstaged_modifications_none(runner, setup_repo):
     assert expected == result
 
 
+def test_unstaged_modifications_stat_cache(runner, setup_repo):
+    """Tests that Repo.unstaged_modifications does not trust the stat of a
+    file hashed moments after it changed, so that an edit keeping its size
+    and mtime is still found.
+    """
+    repo = Repo(Path.cwd())
+    file_a = Path(setup_repo["work_path"] / "a.txt")
+    file_a.write_text("hello")
+    os.utime(file_a, ns=(0, 0))
+    runner.invoke(main, ["add", "a.txt"])
+    runner.invoke(main, ["commit", "Add a.txt"])
+    assert "a.txt" not in repo.load_index().stat_cache
+    file_a.write_text("world")
+    os.utime(file_a, ns=(0, 0))
+    assert repo.unstaged_modifications() == ["a.txt (modified)"]
+
+
 def test_unstaged_modifications_untracked_added_deleted(runner, setup_repo):
     """Tests Repo.unstaged_modifications method for a staged, untracked file
     that has since been deleted.